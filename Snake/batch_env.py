@@ -0,0 +1,263 @@
+import numpy as np
+from snake import DIRECTION_SALTS, LOOP_HASH_BASE, STARVATION_MOVES, nth_free_cell
+from vision import get_vision_tables
+from metrics import DEATH_CAUSES, DISABLED_METRICS
+from seeding import new_root_seed, next_game_seed
+
+# Same order as the Direction enum: UP, RIGHT, DOWN, LEFT
+DIRECTION_DELTAS = np.array([(0, -1), (1, 0), (0, 1), (-1, 0)])
+
+WALL, SELF, STARVATION, WON, LOOP = (DEATH_CAUSES.index(cause)
+                                     for cause in ("wall", "self", "starvation", "won", "loop"))
+
+HASH_BASE = np.uint64(LOOP_HASH_BASE)
+HASH_SALTS = np.array(DIRECTION_SALTS, dtype=np.uint64)
+
+class BatchSnakeEnv:
+    # Runs num_games independent Snake games in lockstep. Every array is
+    # indexed by game first; bodies live in a ring buffer of flat cell indices
+    # (y * grid_width + x) so pushing a head and popping a tail are O(1).
+    # Unused slots hold -1. The buffer starts small and doubles when a body
+    # fills it, so memory follows the longest snake, not the board area.
+    # Food is picked among the empty cells like Snake._spawn_food, from a
+    # generator per game, so a game with the same seed and moves as a Snake
+    # spawns food in the same places. Loops are detected and credited as in
+    # Snake.move, unless detect_loops is off.
+    detect_loops = True
+    def __init__(self, num_games, grid_width, grid_height, initial_capacity=16):
+        self.num_games = num_games
+        # Plain ints, as in Snake, to keep NumPy ints out of the loop hash
+        self.grid_width = int(grid_width)
+        self.grid_height = int(grid_height)
+        self.num_cells = self.grid_width * self.grid_height
+        self.initial_capacity = min(initial_capacity, self.num_cells)
+        self.vision_tables = get_vision_tables(grid_width, grid_height)
+        self.metrics = DISABLED_METRICS
+        self.seeds = None
+        self.reset()
+
+    def reset(self, seeds=None):
+        # One game per seed; the batch takes the size of seeds when given.
+        # Without seeds, the games follow on from the previous batch's first
+        # game, as in Snake.reset.
+        if seeds is None:
+            root = new_root_seed() if self.seeds is None else int(self.seeds[0])
+            seeds = [next_game_seed(root, game) for game in range(self.num_games)]
+        self.num_games = n = len(seeds)
+        self.seeds = np.asarray(seeds, dtype=np.uint64)
+        self.rngs = [np.random.default_rng(int(seed)) for seed in self.seeds]
+        self.capacity = self.initial_capacity
+        self.body = np.full((n, self.capacity), -1, dtype=np.int32)
+        self.head_ptr = np.zeros(n, dtype=np.int64)
+        self.length = np.zeros(n, dtype=np.int64)
+        self.head = np.zeros((n, 2), dtype=np.int64)
+        self.direction = np.zeros(n, dtype=np.int64)
+        self.food = np.zeros((n, 2), dtype=np.int64)
+        self.score = np.zeros(n, dtype=np.int64)
+        self.moves_left = np.full(n, STARVATION_MOVES, dtype=np.int64)
+        self.moves_without_food = np.zeros(n, dtype=np.int64)
+        self.alive = np.ones(n, dtype=bool)
+        self.won = np.zeros(n, dtype=bool)
+        self.death_cause = np.zeros(n, dtype=np.int64)  # index into DEATH_CAUSES
+        self.steps = 0
+        
+        # Direction taken by every game at every step, as in Snake.actions;
+        # game g's own moves are the first num_moves[g] rows
+        self.action_history = []
+        self.num_moves = np.zeros(n, dtype=np.int64)
+
+        # Same starting body as Snake.reset, pushed tail first
+        middle_x = self.grid_width // 2
+        middle_y = self.grid_height // 2
+        games = np.arange(n)
+        for offset in (2, 1, 0):
+            self._push_head(games, np.array([middle_x, middle_y + offset]))
+
+        self._spawn_food(games)
+        self._start_loop_check([(middle_y + offset) * self.grid_width + middle_x for offset in (2, 1, 0)])
+
+    def _start_loop_check(self, start_cells):
+        # Every live game has made the same number of moves, so path position
+        # 3 + steps holds every live head, kept in a ring of the last
+        # path_width positions. saved_key and saved_position are game g's
+        # saved state for Brent's cycle detection (see snake.py).
+        n = self.num_games
+        self.path_width = self.capacity + STARVATION_MOVES + 1
+        self.path = np.zeros((n, self.path_width), dtype=np.int32)
+        self.path[:, :len(start_cells)] = start_cells
+        loop_hash = 0
+        for cell in start_cells:
+            loop_hash = (loop_hash * LOOP_HASH_BASE + cell + 1) % 2 ** 64
+        self.loop_hash = np.full(n, loop_hash, dtype=np.uint64)
+        self.loop_power = np.full(n, pow(LOOP_HASH_BASE, len(start_cells), 2 ** 64), dtype=np.uint64)
+        self.saved_key = self.loop_hash ^ HASH_SALTS[self.direction]
+        self.saved_position = np.full(n, len(start_cells), dtype=np.int64)
+        self.loop_span = np.ones(n, dtype=np.int64)
+        self.since_saved = np.zeros(n, dtype=np.int64)
+
+    def _push_head(self, games, head):
+        if len(games) and self.length[games].max() >= self.capacity:
+            self._grow()
+        cells = head[..., 1] * self.grid_width + head[..., 0]
+        self.head_ptr[games] = (self.head_ptr[games] - 1) % self.capacity
+        self.body[games, self.head_ptr[games]] = cells
+        self.length[games] += 1
+        self.head[games] = head
+
+    def _pop_tail(self, games):
+        # Returns the released tail cells
+        tail_ptr = (self.head_ptr[games] + self.length[games] - 1) % self.capacity
+        tails = self.body[games, tail_ptr]
+        self.length[games] -= 1
+        self.body[games, tail_ptr] = -1
+        return tails
+
+    def _grow(self):
+        # Doubles the ring buffer, unrolling every body to start at slot 0
+        capacity = min(2 * self.capacity, self.num_cells)
+        slots = (self.head_ptr[:, np.newaxis] + np.arange(self.capacity)) % self.capacity
+        body = np.full((self.num_games, capacity), -1, dtype=np.int32)
+        body[:, :self.capacity] = np.take_along_axis(self.body, slots, axis=1)
+        self.body = body
+        self.head_ptr[:] = 0
+        self.capacity = capacity
+
+    def _spawn_food(self, games):
+        # One pick among the empty cells per game, like Snake._spawn_food.
+        # A game with no empty cell left has won and ends.
+        for game in games:
+            num_free = self.num_cells - self.length[game]
+            if num_free == 0:
+                self.won[game] = True
+                self.alive[game] = False
+                self.death_cause[game] = WON
+                self.food[game] = (-1, -1)
+                continue
+            body = self.body[game]
+            cell = nth_free_cell(np.sort(body[body >= 0]), self.rngs[game].integers(num_free))
+            self.food[game] = (cell % self.grid_width, cell // self.grid_width)
+
+    def get_body(self, game):
+        ptrs = (self.head_ptr[game] + np.arange(self.length[game])) % self.capacity
+        cells = self.body[game, ptrs]
+        return [(int(c % self.grid_width), int(c // self.grid_width)) for c in cells]
+
+    def get_vision(self):
+        return self.vision_tables.get_vision_batch(self.head, self.food, self.body)
+
+    def play(self, policy, seeds=None):
+        # Plays every game to the end from a fresh reset. policy maps the
+        # (N, 24) vision matrix to N actions. Returns the number of moves made.
+        self.reset(seeds)
+        moves = 0
+        metrics = self.metrics
+        while self.alive.any():
+            with metrics.phase("vision"):
+                vision = self.get_vision()
+            with metrics.phase("forward"):
+                actions = policy(vision)
+            moves += int(self.alive.sum())
+            with metrics.phase("move"):
+                self.step(actions)
+        metrics.count("steps", moves)
+        metrics.count_deaths(self.death_cause)
+        return moves
+
+    def step(self, actions):
+        # Advances every live game by one move; dead games are left untouched.
+        # Returns the alive mask after the move.
+        live = self.alive.copy()
+        actions = np.asarray(actions)
+        self.steps += 1
+
+        # change_direction: a snake cannot reverse onto itself
+        allowed = live & (actions != (self.direction + 2) % 4)
+        self.direction[allowed] = actions[allowed]
+        self.action_history.append(self.direction.astype(np.uint8))
+        self.num_moves[live] += 1
+
+        self.moves_left[live] -= 1
+        self.moves_without_food[live] += 1
+
+        starved = live & (self.moves_without_food >= STARVATION_MOVES)
+        live &= ~starved
+        self.death_cause[starved] = STARVATION
+
+        new_head = self.head + DIRECTION_DELTAS[self.direction]
+        hit_wall = live & ((new_head[:, 0] < 0) | (new_head[:, 0] >= self.grid_width) |
+                           (new_head[:, 1] < 0) | (new_head[:, 1] >= self.grid_height))
+        live &= ~hit_wall
+        self.death_cause[hit_wall] = WALL
+
+        # Self-collision is checked before the tail moves, like Snake.move
+        cells = np.where(live, new_head[:, 1] * self.grid_width + new_head[:, 0], 0)
+        hit_self = live & (self.body == cells[:, np.newaxis]).any(axis=1)
+        live &= ~hit_self
+        self.death_cause[hit_self] = SELF
+
+        self.alive = live.copy()
+        movers = np.flatnonzero(live)
+        self._push_head(movers, new_head[movers])
+
+        ate = live & np.all(new_head == self.food, axis=1)
+        self.score[ate] += 1
+        self.moves_left[ate] = np.minimum(self.moves_left[ate] + 100, 500)
+        self.moves_without_food[ate] = 0
+
+        shrinking = live & ~ate
+        tails = np.zeros(self.num_games, dtype=np.int32)
+        tails[shrinking] = self._pop_tail(np.flatnonzero(shrinking))
+        self._spawn_food(np.flatnonzero(ate))
+        self._check_loops(cells, tails, shrinking, ate & self.alive)
+
+        return self.alive
+
+    def _check_loops(self, cells, tails, shrinking, eating):
+        # Vectorized Snake loop detection for the games that moved (masks
+        # shrinking and eating): update the rolling hashes, compare each new
+        # state key with the game's saved one, confirm matches on the path
+        # and end confirmed loops as starved. Dead games' loop state is never
+        # read again, so it is updated along with the rest.
+        if self.path_width < self.capacity + STARVATION_MOVES + 1:
+            self._grow_path()
+        position = 3 + self.steps
+        self.path[:, (position - 1) % self.path_width] = cells
+        self.loop_hash = self.loop_hash * HASH_BASE + (cells.astype(np.uint64) + 1)
+        self.loop_hash -= np.where(shrinking, (tails.astype(np.uint64) + 1) * self.loop_power, np.uint64(0))
+        self.loop_power[eating] *= HASH_BASE
+        keys = self.loop_hash ^ HASH_SALTS[self.direction]
+
+        looped = []
+        candidates = np.flatnonzero(shrinking & (keys == self.saved_key)) if self.detect_loops else []
+        for game in candidates:
+            length = self.length[game]
+            saved = self.saved_position[game]
+            window_then = self.path[game, np.arange(saved - length, saved) % self.path_width]
+            window_now = self.path[game, np.arange(position - length, position) % self.path_width]
+            if np.array_equal(window_then, window_now):
+                looped.append(game)
+        if looped:
+            looped = np.array(looped)
+            self.alive[looped] = False
+            self.death_cause[looped] = LOOP
+            self.moves_left[looped] -= STARVATION_MOVES - self.moves_without_food[looped]
+            self.moves_without_food[looped] = STARVATION_MOVES
+
+        # Brent's schedule; eating starts over, as Snake.start_loop_check
+        self.since_saved += shrinking
+        save = shrinking & self.alive & (self.since_saved == self.loop_span)
+        restart = save | eating
+        self.saved_key = np.where(restart, keys, self.saved_key)
+        self.saved_position = np.where(restart, position, self.saved_position)
+        self.loop_span = np.where(eating, 1, np.where(save, 2 * self.loop_span, self.loop_span))
+        self.since_saved = np.where(restart, 0, self.since_saved)
+
+    def _grow_path(self):
+        # Keeps the last path_width positions of every live path in a wider ring
+        width = self.capacity + STARVATION_MOVES + 1
+        positions = np.arange(3 + self.steps - self.path_width, 3 + self.steps)
+        positions = positions[positions >= 0]
+        path = np.zeros((self.num_games, width), dtype=np.int32)
+        path[:, positions % width] = self.path[:, positions % self.path_width]
+        self.path = path
+        self.path_width = width
@@ -0,0 +1,429 @@
+from snake import Snake, Direction
+from neural_network import SnakeAI, batch_forward, episode_fitness
+from genetic import GeneticAlgorithm
+from batch_env import DIRECTION_DELTAS, BatchSnakeEnv
+from metrics import DEATH_CAUSES
+from genome import GENOME_DTYPE, GENOME_SIZE, unpack, unpack_one
+import numpy as np
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import zlib
+
+GRID_WIDTH = 40
+GRID_HEIGHT = 30
+SEED = 1234
+BENCHMARK_VERSION = 1
+
+# Modules a headless training run imports, and packages they must not pull in
+HEADLESS_MODULES = ["snake", "vision", "batch_env", "genome", "genetic", "neural_network",
+                    "checkpoint", "replay", "seeding", "metrics", "train"]
+HEAVY_MODULES = ["matplotlib", "pygame", "imageio", "tkinter", "multiprocessing"]
+
+DELTA_TO_DIRECTION = {
+    (0, -1): Direction.UP,
+    (1, 0): Direction.RIGHT,
+    (0, 1): Direction.DOWN,
+    (-1, 0): Direction.LEFT,
+}
+
+def hamiltonian_cycle(grid_width, grid_height):
+    # Row 0 left to right, rows 1.. snaking over columns 1.., then back up
+    # column 0. Needs an even grid_height to close the loop.
+    cycle = [(x, 0) for x in range(grid_width)]
+    for y in range(1, grid_height):
+        xs = range(grid_width - 1, 0, -1) if y % 2 else range(1, grid_width)
+        cycle.extend((x, y) for x in xs)
+    cycle.extend((0, y) for y in range(grid_height - 1, 0, -1))
+    return cycle
+
+def make_long_snake(length, grid_width=GRID_WIDTH, grid_height=GRID_HEIGHT):
+    # A snake of the given length laid along a Hamiltonian cycle, so it can
+    # keep moving forever without growing, starving or colliding
+    cycle = hamiltonian_cycle(grid_width, grid_height)
+    snake = Snake(grid_width, grid_height, seed=SEED)
+    snake.set_body([cycle[(length - 1 - i) % len(cycle)] for i in range(length)])
+    snake.food = (-1, -1)
+    return snake, cycle
+
+def random_population(size, seed=SEED):
+    rng = np.random.default_rng(seed)
+    return rng.normal(0, 0.3, (size, GENOME_SIZE)).astype(GENOME_DTYPE)
+
+# Each benchmark is a setup function returning (op, ops_per_call): op() is
+# timed, and one call does ops_per_call units of work (moves, calls or
+# generations). Setup runs outside the timing and seeds everything.
+
+def bench_move(length, include_vision=False, grid_width=GRID_WIDTH, grid_height=GRID_HEIGHT):
+    snake, cycle = make_long_snake(length, grid_width, grid_height)
+    position = [length - 1]
+    steps = 1000
+
+    def op():
+        # The snake goes round the cycle without eating; start each call as
+        # if it had just eaten so loop detection doesn't end it
+        snake.start_loop_check()
+        for _ in range(steps):
+            head = cycle[position[0]]
+            position[0] = (position[0] + 1) % len(cycle)
+            nxt = cycle[position[0]]
+            snake.direction = DELTA_TO_DIRECTION[(nxt[0] - head[0], nxt[1] - head[1])]
+            snake.moves_without_food = 0
+            if include_vision:
+                snake.get_vision()
+            if not snake.move():
+                raise RuntimeError(f"Benchmark snake of length {length} died")
+    return op, steps
+
+def bench_vision(length, grid_width=GRID_WIDTH, grid_height=GRID_HEIGHT):
+    snake, _ = make_long_snake(length, grid_width, grid_height)
+    snake.food = (grid_width - 2, grid_height - 2)
+    calls = 1000
+
+    def op():
+        for _ in range(calls):
+            snake.get_vision()
+    return op, calls
+
+def bench_forward_single():
+    # _forward needs no population, so skip SnakeAI.__init__
+    ai = SnakeAI.__new__(SnakeAI)
+    weights = tuple(p[0] for p in unpack(random_population(1)))
+    vision = np.random.default_rng(SEED).random(24)
+    calls = 1000
+
+    def op():
+        for _ in range(calls):
+            ai._forward(vision, weights)
+    return op, calls
+
+def bench_forward_batch(size):
+    weights = unpack(random_population(size))
+    vision = np.random.default_rng(SEED).random((size, 24))
+
+    def op():
+        np.argmax(batch_forward(weights, vision), axis=1)
+    return op, size
+
+def bench_batch_play(size, grid_width=GRID_WIDTH, grid_height=GRID_HEIGHT):
+    # Full games of a fixed random population on fixed food seeds
+    weights = unpack(random_population(size))
+    policy = lambda vision: np.argmax(batch_forward(weights, vision), axis=1)
+    seeds = np.arange(size, dtype=np.uint64)
+    env = BatchSnakeEnv(size, grid_width, grid_height)
+    moves = env.play(policy, seeds=seeds)
+    return (lambda: env.play(policy, seeds=seeds)), moves
+
+def bench_serve(games, num_genomes):
+    # Concurrent Snake games, each asking InferenceServer for its moves;
+    # asyncio only comes in with this benchmark
+    import asyncio
+    from inference_server import InferenceServer, play_sessions
+    population = random_population(num_genomes)
+    genomes = np.arange(games) % num_genomes
+    seeds = np.arange(games)
+
+    async def play():
+        server = InferenceServer(population)
+        await play_sessions(server, genomes, seeds, GRID_WIDTH, GRID_HEIGHT)
+        await server.close()
+        return server.requests
+    moves = asyncio.run(play())
+    return (lambda: asyncio.run(play())), moves
+
+def bench_evolve(size):
+    ga = GeneticAlgorithm(population_size=size, seed=SEED)
+    population = random_population(size)
+    fitness = np.random.default_rng(SEED).exponential(1000, size)
+
+    def op():
+        # Every call is a "new best", so the stagnation logic stays put
+        ga.best_fitness = 0
+        ga.evolve(population, fitness)
+    return op, 1
+
+def bench_generation(size):
+    # One batched generation: every individual plays, then the GA evolves.
+    # The population and food seeds stay fixed so each call does the same work.
+    ga = GeneticAlgorithm(population_size=size, seed=SEED)
+    population = random_population(size)
+    weights = unpack(population)
+    policy = lambda vision: np.argmax(batch_forward(weights, vision), axis=1)
+    seeds = np.arange(size, dtype=np.uint64)
+    env = BatchSnakeEnv(size, GRID_WIDTH, GRID_HEIGHT)
+
+    def op():
+        env.play(policy, seeds=seeds)
+        fitness = episode_fitness(env.score, env.moves_left)
+        ga.best_fitness = 0
+        ga.evolve(population, fitness)
+    return op, 1
+
+BENCHMARKS = {
+    "move/short": ("steps", lambda: bench_move(3)),
+    "move/long": ("steps", lambda: bench_move(250)),
+    "move/crowded": ("steps", lambda: bench_move(1080)),
+    "move+vision/short": ("steps", lambda: bench_move(3, include_vision=True)),
+    "move+vision/crowded": ("steps", lambda: bench_move(1080, include_vision=True)),
+    "vision/short": ("calls", lambda: bench_vision(3)),
+    "vision/crowded": ("calls", lambda: bench_vision(1080)),
+    "vision/board200": ("calls", lambda: bench_vision(250, 200, 200)),
+    "vision/board1000": ("calls", lambda: bench_vision(250, 1000, 1000)),
+    "move+vision/board1000": ("steps", lambda: bench_move(250, True, 1000, 1000)),
+    "forward/single": ("calls", bench_forward_single),
+    "forward/batch100": ("rows", lambda: bench_forward_batch(100)),
+    "forward/batch3000": ("rows", lambda: bench_forward_batch(3000)),
+    "forward/batch20000": ("rows", lambda: bench_forward_batch(20000)),
+    "batch_play/pop100": ("steps", lambda: bench_batch_play(100)),
+    "batch_play/pop3000": ("steps", lambda: bench_batch_play(3000)),
+    "batch_play/pop3000-board200": ("steps", lambda: bench_batch_play(3000, 200, 200)),
+    "batch_play/pop3000-board1000": ("steps", lambda: bench_batch_play(3000, 1000, 1000)),
+    "serve/games1000-genomes1": ("steps", lambda: bench_serve(1000, 1)),
+    "serve/games1000-genomes100": ("steps", lambda: bench_serve(1000, 100)),
+    "evolve/pop100": ("gens", lambda: bench_evolve(100)),
+    "evolve/pop3000": ("gens", lambda: bench_evolve(3000)),
+    "evolve/pop20000": ("gens", lambda: bench_evolve(20000)),
+    "generation/pop100": ("gens", lambda: bench_generation(100)),
+    "generation/pop3000": ("gens", lambda: bench_generation(3000)),
+}
+
+def time_op(op, min_time=0.2, repeat=5):
+    # Best of `repeat` runs, each calling op enough times to last min_time.
+    # Returns seconds per call.
+    op()
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            op()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        number *= max(2, int(min_time / max(elapsed, 1e-9)) + 1)
+    best = elapsed / number
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            op()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+def run_benchmarks(names, min_time=0.2, repeat=5):
+    results = {}
+    for name in names:
+        unit, setup = BENCHMARKS[name]
+        np.random.seed(SEED)
+        op, ops_per_call = setup()
+        per_call = time_op(op, min_time, repeat)
+        results[name] = {
+            "unit": unit,
+            "ns_per_op": per_call / ops_per_call * 1e9,
+            "ops_per_sec": ops_per_call / per_call,
+        }
+        print(f"{name:<30} {results[name]['ns_per_op']:>14.1f} ns/op {results[name]['ops_per_sec']:>14.1f} {unit}/sec")
+    return results
+
+def check_imports(limit=0.05, runs=5):
+    # Imports the headless modules in fresh interpreters and checks the best
+    # time stays under limit seconds without loading any HEAVY_MODULES.
+    # numpy is imported first and not counted: nothing runs without it.
+    code = (
+        "import sys, time, numpy\n"
+        "start = time.perf_counter()\n"
+        f"import {', '.join(HEADLESS_MODULES)}\n"
+        "print(time.perf_counter() - start)\n"
+        f"print(' '.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))\n"
+    )
+    here = os.path.dirname(os.path.abspath(__file__))
+    best = float("inf")
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", code], cwd=here, check=True,
+                                capture_output=True, text=True).stdout.splitlines()
+        best = min(best, float(output[0]))
+        heavy = output[1].split() if len(output) > 1 else []
+
+    print(f"Headless import time: {best * 1000:.1f} ms (limit {limit * 1000:.0f} ms)")
+    ok = best <= limit
+    if heavy:
+        print(f"Headless imports loaded: {', '.join(heavy)}")
+        ok = False
+    return ok
+
+def check_dtypes(size=1000, min_agreement=0.99):
+    # Memory per individual for each genome layout, and whether float32 and
+    # float16-archived genomes play the same games as float64 ones: the same
+    # population plays on the same food seeds at each precision.
+    master = np.random.default_rng(SEED).normal(0, 0.3, (size, GENOME_SIZE))
+    legacy = tuple(p.copy() for p in unpack_one(master[0]))
+    print(f"{'layout':<32} {'bytes/individual':>16}")
+    print(f"{'tuple of six float64 arrays':<32} {sys.getsizeof(legacy) + sum(sys.getsizeof(p) for p in legacy):>16}")
+    for name, dtype in [("float64 row", np.float64), ("float32 row", np.float32), ("float16 archive row", np.float16)]:
+        print(f"{name:<32} {GENOME_SIZE * np.dtype(dtype).itemsize:>16}")
+
+    def fitness(genomes):
+        weights = unpack(genomes)
+        env = BatchSnakeEnv(size, GRID_WIDTH, GRID_HEIGHT)
+        env.play(lambda vision: np.argmax(batch_forward(weights, vision), axis=1),
+                 seeds=np.arange(size, dtype=np.uint64))
+        return episode_fitness(env.score, env.moves_left)
+
+    reference = fitness(master)
+    ok = True
+    print(f"\n{'precision':<32} {'same fitness':>16} {'mean fitness':>14}")
+    print(f"{'float64':<32} {'':>16} {reference.mean():>14.1f}")
+    for name, genomes in [("float32", master.astype(np.float32)),
+                          ("float16 archive -> float32", master.astype(np.float16).astype(np.float32))]:
+        result = fitness(genomes)
+        agreement = np.mean(result == reference)
+        print(f"{name:<32} {agreement:>16.2%} {result.mean():>14.1f}")
+        if name == "float32" and agreement < min_agreement:
+            ok = False
+    return ok
+
+def scripted_move(game, head, direction, food, grid_width, grid_height):
+    # Deterministic in the game state, so many of these games settle into
+    # loops: games cycle through turning in circles, greedy food chasing
+    # with occasional turns, and a hash of the head and direction
+    x, y = head
+    if game % 3 == 0:
+        return (direction + 1) % 4 if game % 2 else (direction + (x + y) % 3) % 4
+    if game % 3 == 1:
+        if (x * 7 + y * 3 + game) % 5 == 0:
+            return (direction + 1) % 4
+        def cost(move):
+            dx, dy = DIRECTION_DELTAS[move]
+            inside = 0 <= x + dx < grid_width and 0 <= y + dy < grid_height
+            return abs(x + dx - food[0]) + abs(y + dy - food[1]) + 100 * (not inside)
+        return min(range(4), key=cost)
+    return zlib.crc32(bytes([x % 256, y % 256, direction, game % 256])) % 4
+
+def check_loops(boards=((20, 15, 150), (8, 6, 150), (40, 30, 90))):
+    # Plays scripted games with loop detection on and off, one Snake at a
+    # time and all at once in BatchSnakeEnv, and checks that detection only
+    # ends looping games early: score and moves_left must be identical
+    # everywhere, death causes too except that "loop" stands for
+    # "starvation", and Snake and BatchSnakeEnv must move alike.
+    ok = True
+    print(f"{'board':<10} {'games':>6} {'loops':>6} {'moves on':>10} {'moves off':>10} {'saved':>7} {'mismatches':>11}")
+    for grid_width, grid_height, size in boards:
+        seeds = np.arange(size, dtype=np.uint64) * 3 + 1
+        batch = {}
+        for detect in (True, False):
+            env = BatchSnakeEnv(size, grid_width, grid_height)
+            env.detect_loops = detect
+            env.reset(seeds)
+            while env.alive.any():
+                env.step(np.array([scripted_move(game, tuple(env.head[game]), int(env.direction[game]),
+                                                 tuple(env.food[game]), grid_width, grid_height)
+                                   for game in range(size)]))
+            history = np.stack(env.action_history)
+            batch[detect] = [(int(env.score[game]), int(env.moves_left[game]), DEATH_CAUSES[env.death_cause[game]],
+                              history[:env.num_moves[game], game].tobytes()) for game in range(size)]
+
+        mismatches = 0
+        moves = {True: 0, False: 0}
+        for game in range(size):
+            serial = {}
+            for detect in (True, False):
+                snake = Snake(grid_width, grid_height, seed=int(seeds[game]))
+                snake.detect_loops = detect
+                while True:
+                    snake.change_direction(Direction(scripted_move(game, snake.body[0], snake.direction.value,
+                                                                   snake.food or (-1, -1), grid_width, grid_height)))
+                    if not snake.move():
+                        break
+                serial[detect] = (snake.score, snake.moves_left, snake.death_cause, bytes(snake.actions))
+                moves[detect] += len(snake.actions)
+            on, off = serial[True], serial[False]
+            cause_on = "starvation" if on[2] == "loop" else on[2]
+            if (on != batch[True][game] or off != batch[False][game] or
+                    on[:2] != off[:2] or cause_on != off[2]):
+                mismatches += 1
+        loops = sum(result[2] == "loop" for result in batch[True])
+        print(f"{f'{grid_width}x{grid_height}':<10} {size:>6} {loops:>6} {moves[True]:>10} {moves[False]:>10} "
+              f"{1 - moves[True] / moves[False]:>7.0%} {mismatches:>11}")
+        ok = ok and mismatches == 0 and loops > 0
+    return ok
+
+def compare(results, baseline, threshold):
+    # Names of benchmarks more than threshold (a fraction) slower than baseline
+    regressions = []
+    print(f"\n{'benchmark':<30} {'baseline':>14} {'current':>14} {'change':>8}")
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]["ns_per_op"]
+        change = result["ns_per_op"] / before - 1
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<30} {before:>11.1f} ns {result['ns_per_op']:>11.1f} ns {change:>+7.1%}{flag}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the simulation, vision, forward pass and GA hot paths.")
+    parser.add_argument("--filter", nargs="+", metavar="SUBSTRING",
+                        help="only run benchmarks whose name contains one of these")
+    parser.add_argument("--list", action="store_true", help="list the benchmarks and exit")
+    parser.add_argument("--json", metavar="PATH", help="write the results as JSON")
+    parser.add_argument("--baseline", metavar="PATH", help="compare against results saved with --json")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="slowdown versus the baseline that counts as a regression (default 0.10 = 10%%)")
+    parser.add_argument("--check-imports", action="store_true",
+                        help="only check that the headless modules import quickly and without GUI/plotting packages")
+    parser.add_argument("--import-limit", type=float, default=0.05,
+                        help="seconds allowed for the headless imports (default 0.05)")
+    parser.add_argument("--check-dtypes", action="store_true",
+                        help="only report genome memory per precision and check float32 fitness parity with float64")
+    parser.add_argument("--check-loops", action="store_true",
+                        help="only check that loop detection leaves scores and moves_left unchanged, "
+                             "in Snake and BatchSnakeEnv alike")
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds per timing run")
+    parser.add_argument("--repeat", type=int, default=5, help="timing runs per benchmark; the best is kept")
+    args = parser.parse_args(argv)
+
+    if args.check_imports:
+        return 0 if check_imports(args.import_limit) else 1
+    if args.check_dtypes:
+        return 0 if check_dtypes() else 1
+    if args.check_loops:
+        return 0 if check_loops() else 1
+
+    names = list(BENCHMARKS)
+    if args.filter:
+        names = [name for name in names if any(f in name for f in args.filter)]
+    if args.list:
+        print("\n".join(names))
+        return 0
+
+    results = run_benchmarks(names, args.min_time, args.repeat)
+
+    if args.json:
+        report = {
+            "version": BENCHMARK_VERSION,
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "results": results,
+        }
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.json}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} benchmark(s) regressed by more than {args.threshold:.0%}: {', '.join(regressions)}")
+            return 1
+        print("No regressions.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
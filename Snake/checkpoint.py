@@ -0,0 +1,174 @@
+import numpy as np
+import hashlib
+import json
+import os
+import pickle
+import queue
+import threading
+
+# A checkpoint is two files sharing a prefix: <prefix>.npy holds the genome
+# matrix as one contiguous block, <prefix>.json the GeneticAlgorithm state.
+# The files are replaced one after the other, so since version 3 the state
+# also records a digest of the genomes it was saved with; a pair left
+# mismatched by a crash between the two writes is refused on load.
+CHECKPOINT_VERSION = 3
+SUPPORTED_CHECKPOINT_VERSIONS = (2, 3)
+
+def checkpoint_paths(prefix):
+    if prefix.endswith(".npy") or prefix.endswith(".json"):
+        prefix = prefix.rsplit(".", 1)[0]
+    return prefix + ".npy", prefix + ".json"
+
+def ga_state(ga):
+    # Everything needed to resume evolving where ga left off
+    return {
+        "version": CHECKPOINT_VERSION,
+        "generation": ga.generation,
+        "population_size": ga.population_size,
+        "mutation_rate": ga.mutation_rate,
+        "default_mutation": ga.default_mutation,
+        "crossover_rate": ga.crossover_rate,
+        "same_best_count": ga.same_best_count,
+        "best_fitness": float(ga.best_fitness),
+        "best_score": int(ga.best_score),
+        "fitness_history": [[float(best), float(avg)] for best, avg in ga.fitness_history],
+        "best_fitness_per_gen": [float(f) for f in ga.best_fitness_per_gen],
+        "seed": ga.seed,
+        "shared_seeds": ga.shared_seeds,
+        "rng_state": ga.rng.bit_generator.state,
+    }
+
+def restore_ga_state(ga, state):
+    ga.generation = state["generation"]
+    ga.population_size = state["population_size"]
+    ga.mutation_rate = state["mutation_rate"]
+    ga.default_mutation = state["default_mutation"]
+    ga.crossover_rate = state["crossover_rate"]
+    ga.same_best_count = state["same_best_count"]
+    ga.best_fitness = state["best_fitness"]
+    ga.best_score = state["best_score"]
+    ga.fitness_history = [tuple(entry) for entry in state["fitness_history"]]
+    ga.best_fitness_per_gen = list(state["best_fitness_per_gen"])
+    ga.seed = state["seed"]
+    ga.shared_seeds = state.get("shared_seeds", False)
+    ga.rng = np.random.default_rng()
+    ga.rng.bit_generator.state = state["rng_state"]
+
+def atomic_write(path, write, mode="wb"):
+    # write(f) goes to a temp file next to path, which then replaces path in
+    # one step, so readers never see a half-written file
+    tmp_path = f"{path}.tmp{os.getpid()}.{threading.get_ident()}"
+    try:
+        with open(tmp_path, mode) as f:
+            write(f)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def genomes_digest(genomes):
+    return hashlib.blake2b(np.ascontiguousarray(genomes), digest_size=16).hexdigest()
+
+def write_checkpoint(prefix, population, state, dtype=None):
+    # dtype (e.g. float16) stores the genomes at a different precision than
+    # they are evolved in; load_checkpoint hands them back as stored
+    genomes_path, state_path = checkpoint_paths(prefix)
+    genomes = np.ascontiguousarray(population, dtype=dtype)
+    state = dict(state, genomes_digest=genomes_digest(genomes))
+    atomic_write(genomes_path, lambda f: np.save(f, genomes))
+    atomic_write(state_path, lambda f: json.dump(state, f), mode="w")
+
+def save_checkpoint(prefix, population, ga, dtype=None):
+    write_checkpoint(prefix, population, ga_state(ga), dtype)
+
+def write_fitness_plot(fitness_history, path="fitness_history.png"):
+    # Uses a bare Figure on the non-interactive Agg canvas rather than pyplot,
+    # so it is safe off the main thread and needs no display. matplotlib is
+    # imported here, on first use, to keep it out of headless startup.
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    
+    best_fitness, avg_fitness = zip(*fitness_history)
+    fig = Figure(figsize=(10, 6))
+    FigureCanvasAgg(fig)
+    ax = fig.subplots()
+    ax.plot(best_fitness, label='Best Fitness')
+    ax.plot(avg_fitness, label='Average Fitness')
+    ax.set_xlabel('Generation')
+    ax.set_ylabel('Fitness')
+    ax.set_title('Fitness over Generations')
+    ax.legend()
+    ax.grid(True)
+    atomic_write(path, lambda f: fig.savefig(f, format="png"))
+
+def load_checkpoint(prefix, mmap=True):
+    # Returns (genomes, state). With mmap the genomes are a read-only memory
+    # map of the .npy file, read once to check the digest and then paged in
+    # as used.
+    genomes_path, state_path = checkpoint_paths(prefix)
+    with open(state_path) as f:
+        state = json.load(f)
+    if state.get("version") not in SUPPORTED_CHECKPOINT_VERSIONS:
+        raise ValueError(f"Unsupported checkpoint version in {state_path}: {state.get('version')}")
+
+    genomes = np.load(genomes_path, mmap_mode="r" if mmap else None, allow_pickle=False)
+    if state["version"] >= 3 and genomes_digest(genomes) != state.get("genomes_digest"):
+        raise ValueError(f"{genomes_path} does not match {state_path}; "
+                         f"the checkpoint was only partly written")
+    return genomes, state
+
+class CheckpointWriter:
+    # Writes generation snapshots (checkpoint, best brain, fitness plot) on a
+    # background thread so training carries on while they are saved. At most
+    # max_pending snapshots wait in the queue; submit blocks beyond that.
+    # dtype is the precision genomes are stored at (see write_checkpoint).
+    def __init__(self, max_pending=2, dtype=None):
+        self.dtype = dtype
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.thread = threading.Thread(target=self._run, name="checkpoint-writer", daemon=True)
+        self.thread.start()
+
+    def submit(self, population, ga, best_brain=None, best_fitness=None,
+               prefix="population", brain_path="best_brain_auto.pkl", plot_path="fitness_history.png"):
+        # Everything is captured now, on the training thread; population must
+        # not be modified afterwards (evolve always returns a new matrix)
+        snapshot = {
+            "prefix": prefix,
+            "population": population,
+            "state": ga_state(ga),
+            "dtype": self.dtype,
+            "best_brain": best_brain,
+            "best_fitness": best_fitness,
+            "brain_path": brain_path,
+            "plot_path": plot_path,
+        }
+        self.queue.put(snapshot)
+
+    def _run(self):
+        while True:
+            snapshot = self.queue.get()
+            try:
+                if snapshot is None:
+                    return
+                self._write(snapshot)
+            except Exception as e:
+                print(f"Error writing checkpoint: {e}")
+            finally:
+                self.queue.task_done()
+
+    def _write(self, snapshot):
+        write_checkpoint(snapshot["prefix"], snapshot["population"], snapshot["state"], snapshot["dtype"])
+        print(f"Population saved to {snapshot['prefix']}")
+
+        if snapshot["best_brain"] is not None:
+            atomic_write(snapshot["brain_path"], lambda f: pickle.dump(snapshot["best_brain"], f))
+            print(f"New best snake saved automatically! Fitness: {snapshot['best_fitness']}")
+
+        history = snapshot["state"]["fitness_history"]
+        if history:
+            write_fitness_plot(history, snapshot["plot_path"])
+            print("Fitness history plot generated!")
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
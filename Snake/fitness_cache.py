@@ -0,0 +1,41 @@
+import hashlib
+from collections import OrderedDict
+
+class FitnessCache:
+    # Results of games already played, keyed by (genome digest, food seed).
+    # A game is fully determined by the genome and its food seed, so an
+    # elite or an unchanged clone that meets the same seed again is looked
+    # up instead of replayed. Beyond `capacity` entries the least recently
+    # used one is evicted.
+    def __init__(self, capacity=10000):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    @staticmethod
+    def digest(genome):
+        # Content hash of one genome row's raw bytes
+        return hashlib.blake2b(genome.tobytes(), digest_size=16).digest()
+
+    def get(self, key):
+        result = self.entries.get(key)
+        if result is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return result
+
+    def put(self, key, result):
+        self.entries[key] = result
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
@@ -1,13 +1,13 @@
 import numpy as np
-import matplotlib
-import os
-import pickle
-
-matplotlib.use('TkAgg')  
-import matplotlib.pyplot as plt
+from genome import GENOME_DTYPE, GENOME_SIZE, LAYER_SHAPES, unpack
+from checkpoint import load_checkpoint, restore_ga_state, write_fitness_plot
+from seeding import food_seed, food_seeds, ga_rng, new_root_seed, shared_food_seed
+from metrics import DISABLED_METRICS
+import time
 
 class GeneticAlgorithm:
-    def __init__(self, population_size=3000, mutation_rate=0.02, crossover_rate=0.7):
+    def __init__(self, population_size=3000, mutation_rate=0.02, crossover_rate=0.7, seed=None,
+                 dtype=GENOME_DTYPE, shared_seeds=False):
         self.population_size = population_size
         self.mutation_rate = mutation_rate
         self.crossover_rate = crossover_rate
@@ -18,42 +18,72 @@ class GeneticAlgorithm:
         self.same_best_count = 0
         self.default_mutation = mutation_rate
         self.best_fitness_per_gen = []
+        # Where last generation's best individual sits in the current population
+        self.best_index = None
+        
+        # Root of every random stream in the run (see seeding.py); the GA
+        # operators draw only from self.rng
+        self.seed = new_root_seed() if seed is None else seed
+        self.rng = ga_rng(self.seed)
+        # With shared_seeds every individual of every generation plays the
+        # same food in its game number episode, so a genome's fitness never
+        # changes and can be cached (see fitness_cache.py)
+        self.shared_seeds = shared_seeds
+        self.metrics = DISABLED_METRICS
+        self.dtype = np.dtype(dtype)
 
-    def initialize_population(self):
-        population = []
-        saved_pop = self.load_population()
-        if saved_pop:
-            print("Loaded saved population.")
+    @classmethod
+    def from_state(cls, state, dtype=GENOME_DTYPE):
+        # A GA that carries on from a ga_state() snapshot
+        ga = cls(population_size=state["population_size"], seed=state["seed"], dtype=dtype)
+        restore_ga_state(ga, state)
+        return ga
+
+    def initialize_population(self, checkpoint=None):
+        # Resume from a checkpoint only when one is asked for; a checkpoint
+        # that cannot be loaded raises rather than starting over
+        if checkpoint is not None:
+            saved_pop = self.load_population(checkpoint)
+            print(f"Loaded saved population from generation {self.generation}.")
+            if saved_pop.dtype != self.dtype:
+                # e.g. a float16 archive; evolving needs the working precision
+                saved_pop = np.asarray(saved_pop, dtype=self.dtype)
             return saved_pop
             
         print("Creating new population...")
-        for _ in range(self.population_size):
-            # Input layer (24) to first hidden layer (16)
-            W1 = np.random.randn(24, 16) * np.sqrt(2 / 40) 
-            b1 = np.zeros(16)
+        population = np.zeros((self.population_size, GENOME_SIZE), dtype=self.dtype)
+        W1, b1, W2, b2, W3, b3 = unpack(population)
+        n = self.population_size
 
-            # First hidden layer (16) to second hidden layer (16)
-            W2 = np.random.randn(16, 8) * np.sqrt(2 / (16 + 8))
-            b2 = np.zeros(8)
+        # Input layer (24) to first hidden layer (16)
+        W1[:] = self.rng.standard_normal((n, 24, 16), dtype=self.dtype) * np.sqrt(2 / 40)
 
-            # Second hidden layer (16) to output layer (4)
-            W3 = np.random.randn(8, 4) * np.sqrt(2 / 12)
-            b3 = np.zeros(4)
+        # First hidden layer (16) to second hidden layer (8)
+        W2[:] = self.rng.standard_normal((n, 16, 8), dtype=self.dtype) * np.sqrt(2 / (16 + 8))
 
-            population.append((W1, b1, W2, b2, W3, b3))
+        # Second hidden layer (8) to output layer (4)
+        W3[:] = self.rng.standard_normal((n, 8, 4), dtype=self.dtype) * np.sqrt(2 / 12)
 
+        # Biases start at zero
         return population
     
-    def evolve(self, population, fitness_scores):
-        new_population = []
+    def evolve(self, population, fitness_scores, selection_scores=None):
+        # population is an (N, GENOME_SIZE) genome matrix; every operator below
+        # runs over all children at once. Elitism and tournaments rank by
+        # selection_scores when given (see SnakeAI.selection_scores), by
+        # fitness otherwise; the best fitness is that of the top-ranked.
+        start = time.perf_counter()
+        fitness_scores = np.asarray(fitness_scores)
+        selection_scores = fitness_scores if selection_scores is None else np.asarray(selection_scores)
+        new_population = np.empty_like(population)
         
         # Elitism - keep the best individuals
-        elite_count = max(1, int(0.05 * self.population_size))
-        elite_indices = np.argsort(fitness_scores)[-elite_count:]
-        elites = [population[idx] for idx in elite_indices]
-        new_population.extend(elites)
+        elite_count = self.num_elites()
+        elite_indices = np.argsort(selection_scores)[-elite_count:]
+        new_population[:elite_count] = population[elite_indices]
+        self.best_index = elite_count - 1
         
-        current_best = max(fitness_scores)
+        current_best = fitness_scores[elite_indices[-1]]
         self.best_fitness_per_gen.append(current_best)
         
         # Check for stagnation and adjust mutation rate if needed
@@ -62,95 +92,91 @@ class GeneticAlgorithm:
             if self.same_best_count > 3:
                 self.mutation_rate = min(0.3, self.mutation_rate * 1.2)
                 print(f"Stagnation detected! Increased mutation rate to {self.mutation_rate}")
+                self.metrics.count("stagnations")
         else:
             self.same_best_count = 0
             self.mutation_rate = self.default_mutation
             self.best_fitness = current_best
         
-        # Create new population through selection, crossover, and mutation
-        while len(new_population) < self.population_size:
-            parent1 = self._tournament_selection(population, fitness_scores, k=5)
-            parent2 = self._tournament_selection(population, fitness_scores, k=5)
-            
-            if np.random.rand() < self.crossover_rate:
-                child = self._crossover(parent1, parent2)
-            else:
-                child = parent1
-                
-            child = self._mutate(child)
-            new_population.append(child)
+        # Create the rest of the population through selection, crossover, and mutation
+        num_children = self.population_size - elite_count
+        parent1 = population[self._tournament_selection(selection_scores, num_children, k=5)]
+        parent2 = population[self._tournament_selection(selection_scores, num_children, k=5)]
+        
+        crossed = self.rng.random(num_children) < self.crossover_rate
+        children = parent1
+        children[crossed] = self._crossover(parent1[crossed], parent2[crossed])
+        
+        new_population[elite_count:] = self._mutate(children)
         
         self.generation += 1
         avg_fitness = np.mean(fitness_scores)
         self.fitness_history.append((current_best, avg_fitness))
         
+        self.metrics.add_time("evolve", time.perf_counter() - start)
         return new_population
 
-    def _tournament_selection(self, population, fitness_scores, k=5):
-        indices = np.random.choice(len(population), k)
-        best_idx = indices[np.argmax([fitness_scores[i] for i in indices])]
-        return population[best_idx]
+    def num_elites(self):
+        # evolve puts this many elites first in the new population, in
+        # increasing fitness order
+        return max(1, int(0.05 * self.population_size))
 
-    def _crossover(self, parent1, parent2):
-        child = []
-        for i, (p1, p2) in enumerate(zip(parent1, parent2)):
-            if len(p1.shape) == 2:
-                rows, cols = p1.shape
-                crossover_row = np.random.randint(0, rows)
-                
-                child_param = p1.copy()
-                child_param[crossover_row:] = p2[crossover_row:]
-            else:
-                weight = np.random.rand()
-                child_param = weight * p1 + (1 - weight) * p2
-            
-            child.append(child_param)
-        return tuple(child)
+    def food_seed(self, individual, episode=0):
+        # Seed for the food of individual's game number episode in the
+        # current generation
+        if self.shared_seeds:
+            return shared_food_seed(self.seed, episode)
+        return food_seed(self.seed, self.generation, individual, episode)
 
-    def _mutate(self, individual):
-        mutated = []
-        for param in individual:
-            mask = np.random.rand(*param.shape) < self.mutation_rate
-            mutation = np.random.normal(0, 0.2, param.shape)
-            mutated_param = param + mutation * mask
-            mutated.append(mutated_param)
-        return tuple(mutated)
+    def food_seeds(self, individuals=None, episode=0):
+        if individuals is None:
+            individuals = range(self.population_size)
+        if self.shared_seeds:
+            return np.full(len(individuals), shared_food_seed(self.seed, episode), dtype=np.uint64)
+        return food_seeds(self.seed, self.generation, individuals, episode)
 
-    def save_population(self, population, filename="population.pkl"):
-        with open(filename, 'wb') as f:
-            pickle.dump(population, f)
-        print(f"Population saved to {filename}")
+    def _tournament_selection(self, fitness_scores, num_winners, k=5):
+        # One k-way tournament per winner; returns the winners' indices
+        candidates = self.rng.integers(0, len(fitness_scores), size=(num_winners, k))
+        best = np.argmax(fitness_scores[candidates], axis=1)
+        return candidates[np.arange(num_winners), best]
 
-    def save_best_snake(self, population, fitness_scores):
-        best_idx = np.argmax(fitness_scores)
-        best_brain = population[best_idx]
-        
-        if fitness_scores[best_idx] >= self.best_fitness:
-            with open('best_brain_auto.pkl', 'wb') as f:
-                pickle.dump(best_brain, f)
-            print(f"New best snake saved automatically! Fitness: {fitness_scores[best_idx]}")
+    def _crossover(self, parent1, parent2):
+        # Weight matrices take their rows from parent2 from a random row on;
+        # bias vectors are a random blend of both parents
+        children = parent1.copy()
+        n = len(children)
+        for params, p1, p2, shape in zip(unpack(children), unpack(parent1), unpack(parent2), LAYER_SHAPES):
+            if len(shape) == 2:
+                rows = shape[0]
+                crossover_row = self.rng.integers(0, rows, size=(n, 1))
+                from_p2 = np.arange(rows) >= crossover_row
+                params[from_p2] = p2[from_p2]
+            else:
+                weight = self.rng.random((n, 1), dtype=children.dtype)
+                params[:] = weight * p1 + (1 - weight) * p2
+        return children
+
+    def _mutate(self, population):
+        # Drawn and applied in the genome dtype, so no float64 temporaries
+        mask = self.rng.random(population.shape, dtype=population.dtype) < self.mutation_rate
+        mutation = self.rng.standard_normal(population.shape, dtype=population.dtype)
+        mutation *= 0.2
+        mutation *= mask
+        mutation += population
+        return mutation
 
-    def load_population(self, filename="population.pkl"):
-        if os.path.exists(filename):
-            try:
-                with open(filename, 'rb') as f:
-                    return pickle.load(f)
-            except Exception as e:
-                print(f"Error loading population: {e}")
-                return None
-        return None
+    def load_population(self, filename="population"):
+        # Restores the GA state and returns the genomes as a read-only memory
+        # map. Raises ValueError if the checkpoint is missing or unreadable.
+        try:
+            population, state = load_checkpoint(filename)
+            restore_ga_state(self, state)
+        except (OSError, ValueError, KeyError) as e:
+            raise ValueError(f"Error loading population from {filename}: {e}") from e
+        return population
 
     def plot_fitness_history(self):
         if len(self.fitness_history) > 0:
-            best_fitness, avg_fitness = zip(*self.fitness_history)
-            plt.figure(figsize=(10, 6))
-            plt.plot(best_fitness, label='Best Fitness')
-            plt.plot(avg_fitness, label='Average Fitness')
-            plt.xlabel('Generation')
-            plt.ylabel('Fitness')
-            plt.title('Fitness over Generations')
-            plt.legend()
-            plt.grid(True)
-            plt.savefig('fitness_history.png')
-            plt.close()
-            print("Fitness history plot generated!")
\ No newline at end of file
+            write_fitness_plot(self.fitness_history)
+            print("Fitness history plot generated!")
@@ -0,0 +1,32 @@
+import numpy as np
+
+# A genome is one flat row holding W1, b1, W2, b2, W3, b3 back to back
+LAYER_SHAPES = [(24, 16), (16,), (16, 8), (8,), (8, 4), (4,)]
+LAYER_SIZES = [int(np.prod(shape)) for shape in LAYER_SHAPES]
+LAYER_OFFSETS = np.concatenate([[0], np.cumsum(LAYER_SIZES)]).tolist()
+GENOME_SIZE = LAYER_OFFSETS[-1]
+GENOME_DTYPE = np.float32
+
+# Genomes are evolved and played in float32 (or float64); checkpoints may
+# also be archived as float16, at half the size and ~3 significant digits
+GENOME_DTYPES = {"float32": np.float32, "float64": np.float64}
+ARCHIVE_DTYPES = {"float16": np.float16, **GENOME_DTYPES}
+
+def layer_slices():
+    return [slice(start, stop) for start, stop in zip(LAYER_OFFSETS[:-1], LAYER_OFFSETS[1:])]
+
+def unpack(genomes):
+    # (N, GENOME_SIZE) matrix -> stacked (N, ...) views W1, b1, W2, b2, W3, b3
+    n = len(genomes)
+    return tuple(genomes[:, s].reshape((n,) + shape) for s, shape in zip(layer_slices(), LAYER_SHAPES))
+
+def unpack_one(genome):
+    # One genome row -> views W1, b1, W2, b2, W3, b3
+    return tuple(genome[s].reshape(shape) for s, shape in zip(layer_slices(), LAYER_SHAPES))
+
+def pack(population, dtype=GENOME_DTYPE):
+    # List of (W1, b1, W2, b2, W3, b3) tuples -> (N, GENOME_SIZE) matrix
+    genomes = np.empty((len(population), GENOME_SIZE), dtype=dtype)
+    for i, params in enumerate(population):
+        genomes[i] = np.concatenate([np.ravel(p) for p in params])
+    return genomes
@@ -1,8 +1,8 @@
 import pygame
 import numpy as np
+import time
 from snake import Direction
-import imageio
-import os
+from recorder import GifRecorder
 
 # Colors
 WHITE = (255, 255, 255)
@@ -34,6 +34,22 @@ class SnakeGameGUI:
         self.running = True
         self.speed = 100
         self.generation_speeds = {0: 60, 10: 200, 50: 600}
+        self.speed_generation = None
+        
+        # Render decimation: a shown snake advances steps_per_frame moves per
+        # frame; snakes that are not shown (see is_watched) run flat out for
+        # frame_budget seconds between frames
+        self.steps_per_frame = 1
+        self.steps_per_frame_options = [1, 5, 25, 100, 500]
+        self.frame_budget = 1 / 30
+        self.render_every = 1
+        self.render_best_only = False
+        
+        # A ReplayEngine being played back instead of a live game
+        self.replay = None
+        # Games a loaded brain has played; game n's food is that of the
+        # GA's individual 0, episode n, so brain runs repeat with --seed
+        self.brain_games = 0
         
         self.network_area_rect = pygame.Rect(0, 0, width//2, height)
         self.game_area_rect = pygame.Rect(width//2, 0, width//2, height)
@@ -47,7 +63,29 @@ class SnakeGameGUI:
         
         self.show_vision = True
         self.show_network = True
-        self.gif_frames = []
+        self.recorder = GifRecorder()
+        
+        # Cached layers for dirty-rect rendering: the static network panel,
+        # one connection layer per chosen move for the current genome, and
+        # the board kept on its own surface
+        self._layout_network()
+        self.network_base = pygame.Surface(self.network_area_rect.size)
+        self.network_base.fill(BLACK)
+        self.draw_buttons(self.network_base)
+        self.network_weights = None
+        self.network_layers = {}
+        self.drawn_output = None
+        self.drawn_neurons = {}
+        self.network_texts = {}
+        
+        self.board_background = pygame.Surface(self.game_area_rect.size)
+        self.board_background.fill(BLACK)
+        pygame.draw.rect(self.board_background, BORDER_COLOR, self.board_background.get_rect(), 3)
+        self.board = self.board_background.copy()
+        self.board_cells = {}
+        self.game_texts = {}
+        self.game_overlay_rects = []
+        self.needs_full_redraw = True
         
     def handle_events(self):
         for event in pygame.event.get():
@@ -69,8 +107,23 @@ class SnakeGameGUI:
                     self.show_vision = not self.show_vision
                 elif event.key == pygame.K_n:
                     self.show_network = not self.show_network
+                    self.needs_full_redraw = True
                 elif event.key == pygame.K_g:
                     self.save_gif()
+                elif event.key == pygame.K_r:
+                    self.recorder.toggle()
+                elif event.key == pygame.K_f:
+                    options = self.steps_per_frame_options
+                    next_idx = (options.index(self.steps_per_frame) + 1) % len(options) if self.steps_per_frame in options else 0
+                    self.steps_per_frame = options[next_idx]
+                    print(f"Simulating {self.steps_per_frame} steps per frame")
+                elif event.key == pygame.K_b:
+                    self.render_best_only = not self.render_best_only
+                    print(f"Render best snake only: {self.render_best_only}")
+                elif event.key in (pygame.K_LEFT, pygame.K_RIGHT) and self.replay is not None:
+                    offset = 100 if event.key == pygame.K_RIGHT else -100
+                    self.replay.seek(self.replay.frame + offset)
+                    self.ai.vision_values = self.snake.get_vision()
             elif event.type == pygame.MOUSEBUTTONDOWN:
                 mouse_pos = pygame.mouse.get_pos()
                 if self.save_button.collidepoint(mouse_pos):
@@ -78,7 +131,7 @@ class SnakeGameGUI:
                 elif self.load_button.collidepoint(mouse_pos):
                     best_brain = self.ai.load_best_brain()
                     if best_brain:
-                        self.ai.current_weights = best_brain
+                        self.ai.replay_brain = best_brain
                         print("Brain loaded!")
                 elif self.graph_button.collidepoint(mouse_pos):
                     self.ga.plot_fitness_history()
@@ -96,62 +149,262 @@ class SnakeGameGUI:
                     self.ga.default_mutation = self.ga.mutation_rate
                     print(f"Mutation rate decreased to {self.ga.mutation_rate:.2f}")
     
-    def draw_buttons(self):
-        pygame.draw.rect(self.screen, WHITE, self.save_button)
-        pygame.draw.rect(self.screen, WHITE, self.load_button)
-        pygame.draw.rect(self.screen, WHITE, self.graph_button)
-        pygame.draw.rect(self.screen, WHITE, self.save_gif_button)
+    def draw_buttons(self, surface):
+        pygame.draw.rect(surface, WHITE, self.save_button)
+        pygame.draw.rect(surface, WHITE, self.load_button)
+        pygame.draw.rect(surface, WHITE, self.graph_button)
+        pygame.draw.rect(surface, WHITE, self.save_gif_button)
         
         save_text = self.font.render("Save", True, BLACK)
         load_text = self.font.render("Load", True, BLACK)
         graph_text = self.font.render("Graph", True, BLACK)
         gif_text = self.font.render("Save GIF", True, BLACK)
         
-        self.screen.blit(save_text, (self.save_button.x + (self.button_width - save_text.get_width()) // 2, 
-                                    self.save_button.y + (self.button_height - save_text.get_height()) // 2))
-        self.screen.blit(load_text, (self.load_button.x + (self.button_width - load_text.get_width()) // 2, 
-                                    self.load_button.y + (self.button_height - load_text.get_height()) // 2))
-        self.screen.blit(graph_text, (self.graph_button.x + (self.button_width - graph_text.get_width()) // 2, 
-                                     self.graph_button.y + (self.button_height - graph_text.get_height()) // 2))
-        self.screen.blit(gif_text, (self.save_gif_button.x + (self.button_width - gif_text.get_width()) // 2, 
-                                   self.save_gif_button.y + (self.button_height - gif_text.get_height()) // 2))
+        surface.blit(save_text, (self.save_button.x + (self.button_width - save_text.get_width()) // 2, 
+                                 self.save_button.y + (self.button_height - save_text.get_height()) // 2))
+        surface.blit(load_text, (self.load_button.x + (self.button_width - load_text.get_width()) // 2, 
+                                 self.load_button.y + (self.button_height - load_text.get_height()) // 2))
+        surface.blit(graph_text, (self.graph_button.x + (self.button_width - graph_text.get_width()) // 2, 
+                                  self.graph_button.y + (self.button_height - graph_text.get_height()) // 2))
+        surface.blit(gif_text, (self.save_gif_button.x + (self.button_width - gif_text.get_width()) // 2, 
+                                self.save_gif_button.y + (self.button_height - gif_text.get_height()) // 2))
+        
+        # Plus and minus buttons for mutation rate
+        plus_button = pygame.Rect(355, 90, 20, 20)
+        minus_button = pygame.Rect(380, 90, 20, 20)
+        pygame.draw.rect(surface, WHITE, plus_button)
+        pygame.draw.rect(surface, WHITE, minus_button)
+        
+        plus_text = self.font.render("+", True, BLACK)
+        minus_text = self.font.render("-", True, BLACK)
+        surface.blit(plus_text, (plus_button.x + 6, plus_button.y + 1))
+        surface.blit(minus_text, (minus_button.x + 7, minus_button.y + 1))
     
-    def draw_game(self):
-        game_area_x = self.width // 2
+    def _layout_network(self):
+        # Network visualization parameters
+        self.layers = [24, 16, 8, 4]  # 24 inputs, 16 and 8 hidden, 4 outputs
+        self.layer_x = [50, 200, 350, 500]
         
-        # Draw game area background
-        pygame.draw.rect(self.screen, BLACK, (game_area_x, 0, self.width//2, self.height))
+        # Calculate neuron positions for each layer
+        self.neurons_y = []
+        for i, n in enumerate(self.layers):
+            spacing = min(15, (self.height - 200) // (n + 2))
+            start_y = (self.height - 120) // 2 - (n * spacing) // 2 + 120
+            self.neurons_y.append([start_y + j * spacing for j in range(n)])
+        
+        # Area holding the second hidden layer, the output layer and the
+        # connections between them, which depend on the chosen move
+        top = min(self.neurons_y[2][0], self.neurons_y[3][0]) - 10
+        bottom = max(self.neurons_y[2][-1], self.neurons_y[3][-1]) + 10
+        self.output_area_rect = pygame.Rect(self.layer_x[2] - 10, top, self.layer_x[3] - self.layer_x[2] + 20, bottom - top)
+        
+        # Fixed subset of hidden connections to draw, to avoid clutter
+        rng = np.random.default_rng(0)
+        self.w1_sample = rng.random((self.layers[0], self.layers[1])) <= 0.05
+        self.w2_sample = rng.random((self.layers[1], self.layers[2])) <= 0.1
+    
+    def _neuron_rect(self, layer, j, radius):
+        return pygame.Rect(self.layer_x[layer] - radius, self.neurons_y[layer][j] - radius, 2 * radius + 1, 2 * radius + 1)
+    
+    def _build_network_layer(self, weights, output_idx):
+        # Everything in the network panel that only changes with the genome
+        # or the chosen move: buttons, connections and plain neurons
+        layer = self.network_base.copy()
+        W1, b1, W2, b2, W3, b3 = weights
+        layers, layer_x, neurons_y = self.layers, self.layer_x, self.neurons_y
+        
+        if output_idx is not None:
+            # Draw connections from layer 2 to output layer
+            for i in range(layers[2]):
+                for j in range(layers[3]):
+                    weight = W3[i, j]
+                    # Highlight the connection to the chosen output
+                    if j == output_idx:
+                        color = LIGHT_GREEN if weight > 0 else RED
+                        width = max(1, min(4, int(abs(weight) * 5)))
+                    else:
+                        if abs(weight) < 0.1:
+                            continue
+                        color = BLUE if weight > 0 else RED
+                        width = max(1, min(2, int(abs(weight) * 3)))
+                    
+                    pygame.draw.line(layer, color, (layer_x[2], neurons_y[2][i]), (layer_x[3], neurons_y[3][j]), width)
+            
+            # Draw connections from layer 1 to layer 2 and from the input
+            # layer to layer 1 (sampled)
+            for src, W, sample in ((1, W2, self.w2_sample), (0, W1, self.w1_sample)):
+                for i, j in zip(*np.nonzero(sample & (np.abs(W) >= 0.2))):
+                    weight = W[i, j]
+                    color = BLUE if weight > 0 else RED
+                    width = max(1, min(2, int(abs(weight) * 2)))
+                    pygame.draw.line(layer, color, (layer_x[src], neurons_y[src][i]), (layer_x[src + 1], neurons_y[src + 1][j]), width)
         
-        # Draw game area border
-        pygame.draw.rect(self.screen, BORDER_COLOR, (game_area_x, 0, self.width//2, self.height), 3)
+        # Draw all neurons
+        for i, n in enumerate(layers):
+            radius = 4 if i == 0 else 6
+            for j in range(n):
+                pygame.draw.circle(layer, WHITE, (layer_x[i], neurons_y[i][j]), radius)
         
-        # Draw snake
-        for i, (x, y) in enumerate(self.snake.body):
+        return layer
+    
+    def _draw_text(self, drawn, slot, text, font, pos, background, offset_x=0, force=False):
+        # Re-renders a text only when its value changes (or force is set),
+        # restoring the old text's area from background. Returns dirty rects.
+        previous = drawn.get(slot)
+        if previous is not None and previous[0] == text and not force:
+            return []
+        
+        dirty = []
+        if previous is not None:
+            old_rect = previous[1]
+            self.screen.blit(background, old_rect, area=old_rect.move(-offset_x, 0))
+            dirty.append(old_rect)
+        
+        rendered = font.render(text, True, WHITE)
+        rect = self.screen.blit(rendered, pos)
+        drawn[slot] = (text, rect)
+        dirty.append(rect)
+        return dirty
+    
+    def draw_network(self, full=False):
+        # Blits the cached layers and redraws only what changed since the
+        # last frame. Returns the dirty rects.
+        weights = self.ai.current_weights
+        
+        # Check if weights are available
+        if not weights or len(weights) != 6:  # W1, b1, W2, b2, W3, b3
+            self.screen.blit(self.network_base, self.network_area_rect)
+            text = self.font.render("Neural network visualization not available", True, WHITE)
+            self.screen.blit(text, (50, self.height//2))
+            self.network_weights = None
+            return [self.network_area_rect]
+        
+        output_idx = None
+        if self.ai.last_output is not None:
+            output_idx = int(np.argmax(self.ai.last_output))
+        
+        # A new genome invalidates every cached connection layer
+        if weights is not self.network_weights:
+            self.network_weights = weights
+            self.network_layers = {}
+            full = True
+        
+        layer = self.network_layers.get(output_idx)
+        if layer is None:
+            layer = self.network_layers[output_idx] = self._build_network_layer(weights, output_idx)
+        
+        dirty = []
+        restored = []
+        if full:
+            self.screen.blit(layer, self.network_area_rect)
+            restored.append(self.network_area_rect)
+            self.drawn_neurons = {}
+            self.network_texts = {}
+        elif output_idx != self.drawn_output:
+            self.screen.blit(layer, self.output_area_rect, area=self.output_area_rect)
+            restored.append(self.output_area_rect)
+        self.drawn_output = output_idx
+        
+        # Highlighted neurons: active inputs (vision values < 0.5) and the chosen output
+        highlights = {}
+        if self.ai.vision_values is not None:
+            for j, value in enumerate(self.ai.vision_values[:self.layers[0]]):
+                if value < 0.5:
+                    highlights[(0, j)] = (LIGHT_GREEN, 5)
+        if output_idx is not None:
+            highlights[(3, output_idx)] = (LIGHT_GREEN, 8)
+        
+        for key, style in self.drawn_neurons.items():
+            if highlights.get(key) != style:
+                rect = self._neuron_rect(key[0], key[1], style[1])
+                self.screen.blit(layer, rect, area=rect)
+                restored.append(rect)
+        
+        for (i, j), (color, radius) in highlights.items():
+            rect = self._neuron_rect(i, j, radius)
+            if self.drawn_neurons.get((i, j)) != (color, radius) or rect.collidelist(restored) != -1:
+                pygame.draw.circle(self.screen, color, (self.layer_x[i], self.neurons_y[i][j]), radius)
+                dirty.append(rect)
+        self.drawn_neurons = highlights
+        dirty.extend(restored)
+        
+        # Draw neural network stats
+        if self.speed == 0:
+            speed_text = "SPEED: MAX"
+        else:
+            speed_text = f"SPEED: {self.speed} FPS"
+        if self.steps_per_frame > 1:
+            speed_text += f" x{self.steps_per_frame}"
+        if self.render_best_only:
+            speed_text += " (BEST ONLY)"
+        elif self.render_every > 1:
+            speed_text += f" (EVERY {self.render_every})"
+        
+        texts = [
+            ("generation", f"GENERATION: {self.ga.generation}", (150, 65)),
+            ("mutation", f"MUTATION RATE: {self.ga.mutation_rate:.2f}", (150, 90)),
+            ("speed", speed_text, (150, 115)),
+            ("population", f"POPULATION SIZE: {self.ga.population_size}", (150, self.height - 120)),
+            ("current_score", f"CURRENT SCORE: {self.snake.score}", (150, self.height - 90)),
+            ("high_score", f"HIGH SCORE: {self.ai.best_score}", (150, self.height - 60)),
+            ("best_fitness", f"BEST FITNESS: {self.ga.best_fitness:.0f}", (150, self.height - 30)),
+        ]
+        for slot, text, pos in texts:
+            dirty.extend(self._draw_text(self.network_texts, slot, text, self.font, pos, layer))
+        
+        return dirty
+    
+    def _cell_rect(self, x, y):
+        return pygame.Rect(x * self.block_size, y * self.block_size, self.block_size, self.block_size)
+    
+    def _update_board(self):
+        # Redraws only the board cells whose contents changed. Returns their
+        # rects in board coordinates.
+        cells = {}
+        for i, cell in enumerate(self.snake.body):
             color_val = max(50, 255 - i * 15)
-            snake_color = (30, color_val, 30)
-            
-            rect = pygame.Rect(
-                game_area_x + x * self.block_size,
-                y * self.block_size,
-                self.block_size,
-                self.block_size
-            )
-            pygame.draw.rect(self.screen, snake_color, rect)
-            
-            pygame.draw.rect(self.screen, (10, 10, 10), rect, 1)
+            cells[cell] = (30, color_val, 30)
+        if self.snake.food is not None:
+            cells[self.snake.food] = RED
+        
+        changed = []
+        for cell in self.board_cells:
+            if cell not in cells:
+                rect = self._cell_rect(*cell)
+                self.board.blit(self.board_background, rect, area=rect)
+                changed.append(rect)
+        
+        for cell, color in cells.items():
+            if self.board_cells.get(cell) != color:
+                rect = self._cell_rect(*cell)
+                pygame.draw.rect(self.board, color, rect)
+                if color != RED:
+                    pygame.draw.rect(self.board, (10, 10, 10), rect, 1)
+                changed.append(rect)
+        
+        self.board_cells = cells
+        return changed
+    
+    def draw_game(self, full=False):
+        # The board lives on its own surface; only changed cells and the
+        # previous frame's overlays are copied back to the screen. Returns the
+        # dirty rects.
+        game_area_x = self.width // 2
+        changed = [rect.move(game_area_x, 0) for rect in self._update_board()]
         
-        # Draw food
-        food_rect = pygame.Rect(
-            game_area_x + self.snake.food[0] * self.block_size,
-            self.snake.food[1] * self.block_size,
-            self.block_size,
-            self.block_size
-        )
-        pygame.draw.rect(self.screen, RED, food_rect)
+        if full:
+            restore = [self.game_area_rect]
+            self.game_texts = {}
+        else:
+            restore = changed + self.game_overlay_rects
+        for rect in restore:
+            self.screen.blit(self.board, rect, area=rect.move(-game_area_x, 0))
         
-        # Draw score
-        score_text = self.big_font.render(f"Score: {self.snake.score}", True, WHITE)
-        self.screen.blit(score_text, (game_area_x + 10, 10))
+        # Draw score, again whenever something was restored over it
+        score = self.game_texts.get("score")
+        force = score is not None and score[1].collidelist(restore) != -1
+        overlay = self._draw_text(self.game_texts, "score", f"Score: {self.snake.score}", self.big_font,
+                                  (game_area_x + 10, 10), self.board, offset_x=game_area_x, force=force)
         
         # Draw vision lines if enabled
         if self.show_vision and self.ai.vision_values is not None:
@@ -168,6 +421,9 @@ class SnakeGameGUI:
             
             max_dist = max(self.snake.grid_width, self.snake.grid_height)
             
+            # Lines stop at the edge of the game area so they never reach the
+            # network panel
+            self.screen.set_clip(self.game_area_rect)
             for i, (dx, dy) in enumerate(directions):
                 vision_idx = i * 3  # Updated for 3 values per direction
                 food_dist = self.ai.vision_values[vision_idx]
@@ -181,200 +437,70 @@ class SnakeGameGUI:
                 end_x = head_center[0] + dx * distance * self.block_size
                 end_y = head_center[1] + dy * distance * self.block_size
                 
-                pygame.draw.line(self.screen, (50, 50, 100), head_center, (end_x, end_y), 1)
+                overlay.append(pygame.draw.line(self.screen, (50, 50, 100), head_center, (end_x, end_y), 1))
                 
                 if food_dist < 1.0:
                     food_x = head_center[0] + dx * int(max_dist * food_dist) * self.block_size
                     food_y = head_center[1] + dy * int(max_dist * food_dist) * self.block_size
-                    pygame.draw.circle(self.screen, (255, 0, 0), (int(food_x), int(food_y)), 3)
+                    overlay.append(pygame.draw.circle(self.screen, (255, 0, 0), (int(food_x), int(food_y)), 3))
                 
                 if body_dist < 1.0:
                     body_x = head_center[0] + dx * int(max_dist * body_dist) * self.block_size
                     body_y = head_center[1] + dy * int(max_dist * body_dist) * self.block_size
-                    pygame.draw.circle(self.screen, (0, 255, 0), (int(body_x), int(body_y)), 3)
-    
-    def draw_network(self):
-        # Clear the network area with black background
-        pygame.draw.rect(self.screen, BLACK, self.network_area_rect)
-        
-        # Draw UI buttons
-        self.draw_buttons()
-        
-        # Check if weights are available
-        if not self.ai.current_weights or len(self.ai.current_weights) != 6:  # Updated for 3 layers (input, 2 hidden, output)
-            text = self.font.render("Neural network visualization not available", True, WHITE)
-            self.screen.blit(text, (50, self.height//2))
-            return
-            
-        W1, b1, W2, b2, W3, b3 = self.ai.current_weights
-        
-        # Draw neural network stats
-        gen_text = self.font.render(f"GENERATION: {self.ga.generation}", True, WHITE)
-        self.screen.blit(gen_text, (150, 65))
-        
-        # Draw mutation rate with + and - buttons
-        mutation_text = self.font.render(f"MUTATION RATE: {self.ga.mutation_rate:.2f}", True, WHITE)
-        self.screen.blit(mutation_text, (150, 90))
-        
-        # Plus and minus buttons for mutation rate
-        plus_button = pygame.Rect(355, 90, 20, 20)
-        minus_button = pygame.Rect(380, 90, 20, 20)
-        pygame.draw.rect(self.screen, WHITE, plus_button)
-        pygame.draw.rect(self.screen, WHITE, minus_button)
-        
-        plus_text = self.font.render("+", True, BLACK)
-        minus_text = self.font.render("-", True, BLACK)
-        self.screen.blit(plus_text, (plus_button.x + 6, plus_button.y + 1))
-        self.screen.blit(minus_text, (minus_button.x + 7, minus_button.y + 1))
-        
-        # Current snake info
-        score_text = self.font.render(f"CURRENT SCORE: {self.snake.score}", True, WHITE)
-        self.screen.blit(score_text, (150, self.height - 90))
-        
-        highscore_text = self.font.render(f"HIGH SCORE: {self.ai.best_score}", True, WHITE)
-        self.screen.blit(highscore_text, (150, self.height - 60))
-        
-        best_fitness_text = self.font.render(f"BEST FITNESS: {self.ga.best_fitness:.0f}", True, WHITE)
-        self.screen.blit(best_fitness_text, (150, self.height - 30))
-        
-        population_text = self.font.render(f"POPULATION SIZE: {self.ga.population_size}", True, WHITE)
-        self.screen.blit(population_text, (150, self.height - 120))
-        
-        if self.speed == 0:
-            speed_text = "SPEED: MAX"
-        else:
-            speed_text = f"SPEED: {self.speed} FPS"
-        speed_display = self.font.render(speed_text, True, WHITE)
-        self.screen.blit(speed_display, (150, 115))
-        
-        # Network visualization parameters
-        layers = [24, 16, 8, 4]  # Updated for 24 inputs, 2x16 hidden layers, 4 outputs
-        layer_x = [50, 200, 350, 500]  # Adjusted x positions for better spacing
-        layer_colors = [WHITE, WHITE, WHITE, WHITE]
-        
-        # Calculate neuron positions for each layer
-        neurons_y = []
-        for i, n in enumerate(layers):
-            spacing = min(15, (self.height - 200) // (n + 2))
-            start_y = (self.height - 120) // 2 - (n * spacing) // 2 + 120
-            neurons_y.append([start_y + j * spacing for j in range(n)])
+                    overlay.append(pygame.draw.circle(self.screen, (0, 255, 0), (int(body_x), int(body_y)), 3))
+            self.screen.set_clip(None)
         
-        # Map output indices to direction names for better visualization
-        direction_names = ["UP", "RIGHT", "DOWN", "LEFT"]
-        
-        # Draw connections if network visualization is enabled
-        if self.show_network and self.ai.last_output is not None:
-            max_output_idx = np.argmax(self.ai.last_output)
-            
-            # Draw connections from layer 2 to output layer
-            for i in range(layers[2]):
-                for j in range(layers[3]):
-                    weight = W3[i, j]
-                    # Highlight the connection to the chosen output
-                    if j == max_output_idx:
-                        color = LIGHT_GREEN if weight > 0 else RED
-                        width = max(1, min(4, int(abs(weight) * 5)))
-                    else:
-                        if abs(weight) < 0.1:
-                            continue
-                        color = BLUE if weight > 0 else RED
-                        width = max(1, min(2, int(abs(weight) * 3)))
-                    
-                    pygame.draw.line(
-                        self.screen,
-                        color,
-                        (layer_x[2], neurons_y[2][i]),
-                        (layer_x[3], neurons_y[3][j]),
-                        width
-                    )
-            
-            # Draw connections from layer 1 to layer 2 (sample to avoid clutter)
-            connection_sample_rate = 0.1
-            for i in range(layers[1]):
-                for j in range(layers[2]):
-                    if np.random.rand() > connection_sample_rate:
-                        continue
-                        
-                    weight = W2[i, j]
-                    if abs(weight) < 0.2:
-                        continue
-                        
-                    color = BLUE if weight > 0 else RED
-                    width = max(1, min(2, int(abs(weight) * 2)))
-                    
-                    pygame.draw.line(
-                        self.screen,
-                        color,
-                        (layer_x[1], neurons_y[1][i]),
-                        (layer_x[2], neurons_y[2][j]),
-                        width
-                    )
-            
-            # Draw connections from input layer to layer 1 (sample to avoid clutter)
-            connection_sample_rate = 0.05
-            for i in range(layers[0]):
-                for j in range(layers[1]):
-                    if np.random.rand() > connection_sample_rate:
-                        continue
-                        
-                    weight = W1[i, j]
-                    if abs(weight) < 0.2:
-                        continue
-                        
-                    color = BLUE if weight > 0 else RED
-                    width = max(1, min(2, int(abs(weight) * 2)))
-                    
-                    pygame.draw.line(
-                        self.screen,
-                        color,
-                        (layer_x[0], neurons_y[0][i]),
-                        (layer_x[1], neurons_y[1][j]),
-                        width
-                    )
-        
-        # Determine active input neurons based on vision values
-        active_inputs = []
-        if self.ai.vision_values is not None:
-            for i in range(len(self.ai.vision_values)):
-                # For each of the 8 directions, we have 3 values
-                # Values represent distances (lower is closer)
-                active_inputs.append(self.ai.vision_values[i] < 0.5)
-        
-        # Draw all neurons
-        for i, layer in enumerate(layers):
-            for j in range(layer):
-                radius = 4 if i == 0 else 6
-                color = layer_colors[i]
-                
-                # Highlight input layer nodes based on vision
-                if i == 0 and j < len(active_inputs):
-                    if active_inputs[j]:
-                        color = LIGHT_GREEN
-                        radius = 5
-                
-                # Highlight output layer based on decision
-                if i == 3 and self.ai.last_output is not None:
-                    if j == np.argmax(self.ai.last_output):
-                        color = LIGHT_GREEN
-                        radius = 8
-                
-                pygame.draw.circle(self.screen, color, (layer_x[i], neurons_y[i][j]), radius)
+        self.game_overlay_rects = [rect for rect in overlay if rect.width and rect.height]
+        return restore + overlay
               
     def save_gif(self, filename="snake_game.gif", duration=0.1):
-        if not self.gif_frames:
-            print("No frames to save.")
-            return
-            
-        imageio.mimsave(filename, self.gif_frames, duration=duration)
-        print(f"GIF saved to {filename}")
-        self.gif_frames = []
+        # Encodes in the background; the game keeps running meanwhile
+        self.recorder.save(filename, duration)
     
-    def update(self):
-        # Automatically adjust speed based on generation
-        for gen, speed in self.generation_speeds.items():
-            if self.ga.generation == gen and self.speed != 0:
-                self.speed = speed
-                print(f"Speed automatically adjusted to {speed} FPS at generation {gen}")
+    def render(self):
+        with self.ai.metrics.phase("render"):
+            self._render()
+    
+    def _render(self):
+        # Draw what changed since the last frame
+        full = self.needs_full_redraw
+        self.needs_full_redraw = False
+        if full:
+            self.screen.fill(BLACK)
+        dirty = []
+        if self.show_network:
+            dirty.extend(self.draw_network(full))
+        dirty.extend(self.draw_game(full))
+        
+        # Update display
+        if full:
+            pygame.display.flip()
+        else:
+            pygame.display.update(dirty)
+    
+    def play_replay(self, engine):
+        # Shows a recorded episode (see replay.py) instead of training
+        self.replay = engine
+        self.snake = engine.snake
+        self.ai.vision_values = self.snake.get_vision()
+        self.needs_full_redraw = True
+    
+    def is_watched(self):
+        # Whether the snake now playing is shown at the normal frame rate
+        if self.replay is not None or self.ai.replay_brain is not None:
+            return True
+        if self.render_best_only and self.ga.best_index is not None:
+            return self.ai.current_snake_idx == self.ga.best_index
+        return self.ai.current_snake_idx % self.render_every == 0
+    
+    def step(self):
+        if self.replay is not None:
+            # Recorded moves only; restart from the beginning once done
+            if not self.replay.step():
+                print(f"Replay finished with score {self.snake.score}")
+                self.replay.seek(0)
+            self.ai.vision_values = self.snake.get_vision()
+            return
         
         # Get vision data and determine move
         vision = self.snake.get_vision()
@@ -386,28 +512,40 @@ class SnakeGameGUI:
         
         # If snake died, update fitness and reset
         if not alive:
-            self.ai.update_fitness(self.snake.score, self.snake.moves_left)
-            self.snake.reset()
-        
-        # Draw everything
-        self.screen.fill(BLACK)
-        if self.show_network:
-            self.draw_network()
-        self.draw_game()
-        
-        # Update display
-        pygame.display.flip()
+            if self.ai.replay_brain is not None:
+                print(f"Replay finished with score {self.snake.score}")
+                self.brain_games += 1
+                self.snake.reset(self.ga.food_seed(0, self.brain_games))
+            else:
+                self.ai.update_fitness(self.snake.score, self.snake.moves_left)
+                self.snake.reset(self.ai.current_food_seed())
+    
+    def update(self):
+        # Automatically adjust speed once per listed generation
+        if self.ga.generation in self.generation_speeds and self.speed_generation != self.ga.generation:
+            self.speed_generation = self.ga.generation
+            if self.speed != 0:
+                self.speed = self.generation_speeds[self.ga.generation]
+                print(f"Speed automatically adjusted to {self.speed} FPS at generation {self.ga.generation}")
+        
+        # Simulate up to the next displayed frame; only the latest state is drawn
+        watched = self.is_watched()
+        deadline = time.perf_counter() + self.frame_budget
+        steps = 0
+        while True:
+            self.step()
+            steps += 1
+            if watched:
+                if steps >= self.steps_per_frame:
+                    break
+            elif self.is_watched() or time.perf_counter() >= deadline:
+                break
+        
+        self.render()
         
         # Control frame rate
-        if self.speed > 0:
+        if watched and self.speed > 0:
             self.clock.tick(self.speed)
             
-        # Capture frame for GIF if both visualizations are enabled
-        if self.show_vision and self.show_network and len(self.gif_frames) < 200:  # Limit frames to avoid memory issues
-            pygame.image.save(self.screen, "temp.png")
-            self.gif_frames.append(imageio.imread("temp.png"))
-            if os.path.exists("temp.png"):  # Check if file exists before removing
-                try:
-                    os.remove("temp.png")
-                except:
-                    pass
\ No newline at end of file
+        # Capture frame for GIF if recording is armed
+        self.recorder.capture(self.screen)
@@ -0,0 +1,373 @@
+from snake import Snake, Direction
+from neural_network import batch_forward, shared_forward
+from genome import GENOME_DTYPE, pack, unpack
+from checkpoint import load_checkpoint
+import numpy as np
+import argparse
+import asyncio
+import pickle
+import socket
+import sys
+import time
+
+DEFAULT_PORT = 8765
+
+# Wire format of the socket front end. A request is a genome index and a
+# vision vector; the reply is one byte, the move (a Direction value) or
+# ERROR_REPLY if the request could not be answered. Requests on one
+# connection may be pipelined and are answered in order.
+REQUEST_DTYPE = np.dtype([("genome", "<u4"), ("vision", "<f4", 24)])
+ERROR_REPLY = 255
+
+# Requests for one genome get a forward pass of their own from this many
+# on; below it the per-pass overhead outweighs skipping the weight gather
+MIN_SHARED_ROWS = 32
+
+# Histogram bucket upper edges
+LATENCY_EDGES = [50e-6, 100e-6, 200e-6, 500e-6, 1e-3, 2e-3, 5e-3, 10e-3, 20e-3, 50e-3, 100e-3]
+
+class Histogram:
+    # Counts of observed values per bucket: bucket i holds the values up to
+    # edges[i] (and above edges[i - 1]), the last bucket everything above
+    # edges[-1]. Memory stays fixed however many values are observed.
+    def __init__(self, edges, scale=1.0, unit=""):
+        self.edges = np.asarray(edges, dtype=np.float64)
+        self.counts = np.zeros(len(self.edges) + 1, dtype=np.int64)
+        self.scale = scale  # values are reported multiplied by scale, in unit
+        self.unit = unit
+        self.total = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, values):
+        values = np.atleast_1d(np.asarray(values, dtype=np.float64))
+        self.counts += np.bincount(np.searchsorted(self.edges, values), minlength=len(self.counts))
+        self.total += len(values)
+        self.sum += float(values.sum())
+        self.max = max(self.max, float(values.max()))
+
+    def mean(self):
+        return self.sum / self.total if self.total else 0.0
+
+    def percentile(self, q):
+        # Upper edge of the bucket holding the q-th percentile, capped at the
+        # largest value seen, so never an underestimate nor above the max
+        if not self.total:
+            return 0.0
+        bucket = int(np.searchsorted(np.cumsum(self.counts), q / 100 * self.total))
+        return min(float(self.edges[bucket]), self.max) if bucket < len(self.edges) else self.max
+
+    def summary(self):
+        return {
+            "count": self.total,
+            "mean": self.mean() * self.scale,
+            "p50": self.percentile(50) * self.scale,
+            "p95": self.percentile(95) * self.scale,
+            "p99": self.percentile(99) * self.scale,
+            "max": self.max * self.scale,
+            "buckets": {f"<={edge * self.scale:g}": int(count) for edge, count in zip(self.edges, self.counts)}
+                       | {f">{self.edges[-1] * self.scale:g}": int(self.counts[-1])},
+        }
+
+    def format(self, title):
+        lines = [f"{title}: mean {self.mean() * self.scale:.3g}{self.unit}, "
+                 f"p50 {self.percentile(50) * self.scale:.3g}{self.unit}, "
+                 f"p99 {self.percentile(99) * self.scale:.3g}{self.unit}, max {self.max * self.scale:.3g}{self.unit}"]
+        for label, count in self.summary()["buckets"].items():
+            if count:
+                share = count / self.total
+                lines.append(f"  {label + self.unit:>10} {count:>10} {share:>7.1%} {'#' * round(share * 40)}")
+        return "\n".join(lines)
+
+class InferenceServer:
+    # Answers move requests for the genomes of a population matrix from
+    # many concurrent games on one asyncio event loop. Requests queue up and
+    # are run as micro-batches: a batch starts once max_batch requests wait
+    # or the oldest one has waited max_wait seconds, whichever comes first.
+    # Within a batch, each genome with at least MIN_SHARED_ROWS requests
+    # gets one forward pass with plain matrix products; all other requests
+    # go through one gathered batch_forward together. Batch sizes and the
+    # time requests spend queued are kept as histograms.
+    def __init__(self, population, max_batch=256, max_wait=0.002):
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.set_population(population)
+        self.pending = []
+        self.ready = None
+        self.batcher = None
+        self.requests = 0
+        self.forward_passes = 0
+        self.batch_sizes = Histogram(np.unique(np.append(2 ** np.arange(int(np.log2(max_batch)) + 1), max_batch)))
+        self.queue_latency = Histogram(LATENCY_EDGES, scale=1000, unit="ms")
+
+    def set_population(self, population):
+        # Takes effect from the next batch; e.g. a new generation's genomes
+        self.population = population
+        self.weights = unpack(population)
+
+    def submit(self, genome, vision):
+        # Queues one request and returns a future for its move. Must be
+        # called from the event loop thread.
+        if not 0 <= genome < len(self.population):
+            raise IndexError(f"No genome {genome} in a population of {len(self.population)}")
+        if self.batcher is None:
+            self.ready = asyncio.Event()
+            self.batcher = asyncio.get_running_loop().create_task(self._batch_loop())
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((genome, vision, future, time.perf_counter()))
+        if len(self.pending) == 1 or len(self.pending) >= self.max_batch:
+            self.ready.set()
+        return future
+
+    async def get_move(self, genome, vision):
+        return await self.submit(genome, vision)
+
+    async def _batch_loop(self):
+        while True:
+            await self.ready.wait()
+            self.ready.clear()
+            if not self.pending:
+                continue
+            if len(self.pending) < self.max_batch:
+                # Wait out the oldest request's max_wait, unless the batch fills
+                wait = self.pending[0][3] + self.max_wait - time.perf_counter()
+                if wait > 0:
+                    try:
+                        await asyncio.wait_for(self.ready.wait(), wait)
+                    except asyncio.TimeoutError:
+                        pass
+                    self.ready.clear()
+            batch = self.pending[:self.max_batch]
+            del self.pending[:self.max_batch]
+            self._run_batch(batch)
+            if self.pending:
+                self.ready.set()
+
+    def _run_batch(self, batch):
+        start = time.perf_counter()
+        self.requests += len(batch)
+        self.batch_sizes.observe(len(batch))
+        self.queue_latency.observe(start - np.array([request[3] for request in batch]))
+        try:
+            genomes = np.array([request[0] for request in batch])
+            moves = self.get_moves(genomes, np.stack([request[1] for request in batch]))
+        except Exception as e:
+            for request in batch:
+                if not request[2].done():
+                    request[2].set_exception(e)
+            return
+        for request, move in zip(batch, moves.tolist()):
+            if not request[2].done():  # the game may have been cancelled meanwhile
+                request[2].set_result(move)
+
+    def get_moves(self, genomes, visions):
+        # Row n of visions goes through genome genomes[n]
+        moves = np.empty(len(genomes), dtype=np.int64)
+        order = np.argsort(genomes, kind="stable")
+        unique, starts, counts = np.unique(genomes[order], return_index=True, return_counts=True)
+        shared = counts >= MIN_SHARED_ROWS
+        for genome, start, count in zip(unique[shared], starts[shared], counts[shared]):
+            rows = order[start:start + count]
+            weights = tuple(p[genome] for p in self.weights)
+            moves[rows] = np.argmax(shared_forward(weights, visions[rows]), axis=1)
+            self.forward_passes += 1
+        rest = order[~np.repeat(shared, counts)]
+        if len(rest):
+            moves[rest] = np.argmax(batch_forward(self.weights, visions[rest], genomes[rest]), axis=1)
+            self.forward_passes += 1
+        return moves
+
+    async def serve(self, host="127.0.0.1", port=DEFAULT_PORT, path=None):
+        # Socket front end on a local TCP port, or a Unix socket at path.
+        # Returns the asyncio server; requests join the same micro-batches
+        # as in-process ones.
+        if path is not None:
+            return await asyncio.start_unix_server(self._handle_connection, path)
+        return await asyncio.start_server(self._handle_connection, host, port)
+
+    async def _handle_connection(self, reader, writer):
+        replies = asyncio.Queue()
+        sender = asyncio.get_running_loop().create_task(self._send_replies(replies, writer))
+        buffer = b""
+        try:
+            while True:
+                data = await reader.read(1 << 16)
+                if not data:
+                    break
+                buffer += data
+                count = len(buffer) // REQUEST_DTYPE.itemsize
+                requests = np.frombuffer(buffer, REQUEST_DTYPE, count)
+                buffer = buffer[count * REQUEST_DTYPE.itemsize:]
+                replies.put_nowait([self._submit_or_fail(int(genome), vision)
+                                    for genome, vision in zip(requests["genome"], requests["vision"])])
+        except ConnectionError:
+            pass
+        finally:
+            replies.put_nowait(None)
+            await sender
+            writer.close()
+
+    def _submit_or_fail(self, genome, vision):
+        try:
+            return self.submit(genome, vision)
+        except IndexError as e:
+            future = asyncio.get_running_loop().create_future()
+            future.set_exception(e)
+            return future
+
+    async def _send_replies(self, replies, writer):
+        # Answers each chunk of requests, in the order they arrived
+        while (futures := await replies.get()) is not None:
+            moves = await asyncio.gather(*futures, return_exceptions=True)
+            try:
+                writer.write(bytes(ERROR_REPLY if isinstance(move, Exception) else move for move in moves))
+                await writer.drain()
+            except ConnectionError:
+                return
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "forward_passes": self.forward_passes,
+            "batch_size": self.batch_sizes.summary(),
+            "queue_latency_ms": self.queue_latency.summary(),
+        }
+
+    def report(self):
+        print(f"Served {self.requests} moves in {self.batch_sizes.total} batches "
+              f"({self.forward_passes} forward passes)")
+        print(self.batch_sizes.format("Batch size"))
+        print(self.queue_latency.format("Queue latency"))
+
+    async def close(self):
+        if self.batcher is not None:
+            self.batcher.cancel()
+            try:
+                await self.batcher
+            except asyncio.CancelledError:
+                pass
+            self.batcher = None
+
+class InferenceClient:
+    # Blocking client for InferenceServer.serve, e.g. for evaluation
+    # workers in other processes. get_moves sends all its requests before
+    # reading the replies, so they can share the server's batches.
+    def __init__(self, host="127.0.0.1", port=DEFAULT_PORT, path=None):
+        if path is not None:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.connect(path)
+        else:
+            self.sock = socket.create_connection((host, port))
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def get_moves(self, genomes, visions):
+        requests = np.empty(len(visions), dtype=REQUEST_DTYPE)
+        requests["genome"] = genomes
+        requests["vision"] = visions
+        self.sock.sendall(requests.tobytes())
+        replies = bytearray()
+        while len(replies) < len(requests):
+            data = self.sock.recv(len(requests) - len(replies))
+            if not data:
+                raise ConnectionError("Inference server closed the connection")
+            replies += data
+        moves = np.frombuffer(replies, dtype=np.uint8)
+        if (moves == ERROR_REPLY).any():
+            raise ValueError(f"Inference server could not answer {int((moves == ERROR_REPLY).sum())} requests")
+        return moves.astype(np.int64)
+
+    def get_move(self, genome, vision):
+        return int(self.get_moves([genome], [vision])[0])
+
+    def policy(self, genomes):
+        # BatchSnakeEnv policy playing game n with genome genomes[n]
+        return lambda vision_batch: self.get_moves(genomes, vision_batch)
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+async def play_session(server, genome, grid_width, grid_height, seed=None):
+    # One game played with moves from the server; returns the finished Snake
+    snake = Snake(grid_width, grid_height, seed)
+    while True:
+        move = await server.get_move(genome, snake.get_vision())
+        snake.change_direction(Direction(move))
+        if not snake.move():
+            return snake
+
+async def play_sessions(server, genomes, seeds, grid_width, grid_height):
+    # Game k is played by genome genomes[k] with food seed seeds[k], all at once
+    return await asyncio.gather(*(play_session(server, int(genome), grid_width, grid_height, int(seed))
+                                  for genome, seed in zip(genomes, seeds)))
+
+def load_genomes(brain=None, checkpoint=None):
+    # A population checkpoint, or a saved brain as a population of one
+    if checkpoint is not None:
+        genomes, _ = load_checkpoint(checkpoint, mmap=False)
+        if genomes.dtype == np.float16:
+            genomes = genomes.astype(GENOME_DTYPE)
+        return genomes
+    with open(brain, "rb") as f:
+        return pack([pickle.load(f)])
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve Snake AI moves to many concurrent games in micro-batches.")
+    parser.add_argument("--brain", default="best_brain.pkl", help="saved brain to serve")
+    parser.add_argument("--checkpoint", metavar="CHECKPOINT",
+                        help="serve every genome of a population checkpoint (e.g. population) instead")
+    parser.add_argument("--max-batch", type=int, default=256, help="most requests run in one batch")
+    parser.add_argument("--max-wait-ms", type=float, default=2.0,
+                        help="longest a request waits for its batch to fill")
+    parser.add_argument("--games", type=int, default=256,
+                        help="concurrent in-process games to play, spread over the genomes")
+    parser.add_argument("--seed", type=int, help="seed for the games' food")
+    parser.add_argument("--grid-width", type=int, default=40)
+    parser.add_argument("--grid-height", type=int, default=30)
+    parser.add_argument("--serve", action="store_true",
+                        help="answer socket clients until interrupted instead of playing games")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--unix", metavar="PATH", help="listen on a Unix socket instead of a TCP port")
+    return parser.parse_args(argv)
+
+async def run(args, genomes):
+    server = InferenceServer(genomes, max_batch=args.max_batch, max_wait=args.max_wait_ms / 1000)
+    try:
+        if args.serve:
+            listener = await server.serve(args.host, args.port, args.unix)
+            print(f"Serving {len(genomes)} genomes on {args.unix or f'{args.host}:{args.port}'}")
+            async with listener:
+                await listener.serve_forever()
+        else:
+            seeds = np.random.default_rng(args.seed).integers(2 ** 31, size=args.games)
+            start = time.perf_counter()
+            snakes = await play_sessions(server, np.arange(args.games) % len(genomes), seeds,
+                                         args.grid_width, args.grid_height)
+            elapsed = time.perf_counter() - start
+            scores = [snake.score for snake in snakes]
+            print(f"Played {len(snakes)} games in {elapsed:.2f}s ({server.requests / elapsed:.0f} moves/sec), "
+                  f"best score {max(scores)}, mean {np.mean(scores):.2f}")
+    finally:
+        await server.close()
+        server.report()
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        genomes = load_genomes(args.brain, args.checkpoint)
+    except (OSError, ValueError) as e:
+        print(f"Could not load genomes: {e}")
+        sys.exit(1)
+    try:
+        asyncio.run(run(args, genomes))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
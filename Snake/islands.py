@@ -0,0 +1,184 @@
+from genetic import GeneticAlgorithm
+from neural_network import SnakeAI
+from snake import Snake
+from batch_env import BatchSnakeEnv
+from checkpoint import atomic_write, ga_state, write_checkpoint
+from genome import GENOME_DTYPE, unpack_one
+from seeding import island_seed, migration_rng, new_root_seed
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import contextlib
+import io
+import json
+import os
+import pickle
+import time
+
+TOPOLOGIES = ("ring", "random")
+
+def _run_island(population, state, generations, grid, options):
+    # Plays and evolves one island for `generations` generations in a worker
+    # process. The island's whole state travels with the task and comes back
+    # with the result, so islands share nothing between migrations.
+    from train import HeadlessTrainer
+
+    # Every island would print its own per-generation lines
+    with contextlib.redirect_stdout(io.StringIO()):
+        ga = GeneticAlgorithm.from_state(state, dtype=population.dtype)
+        ai = SnakeAI(ga, checkpoint_every=0, population=population, **options)
+
+        trainer = HeadlessTrainer(Snake(*grid), ai, ga, env=BatchSnakeEnv(len(population), *grid))
+        try:
+            for _ in range(generations):
+                trainer.run_generation()
+        finally:
+            ai.close()
+    return ai.population, ga_state(ga), trainer.total_moves
+
+class IslandModel:
+    # num_islands sub-populations, each evolved by its own GeneticAlgorithm
+    # in a worker process. Islands run migration_interval generations on
+    # their own, then each sends copies of its best `migrants` individuals
+    # to another island (the next one for "ring"; for "random", a random
+    # other one that no other island sends to), where they replace the
+    # newest children. The population is split as evenly as possible.
+    def __init__(self, num_islands, population_size, grid_width, grid_height, mutation_rate=0.02,
+                 seed=None, dtype=GENOME_DTYPE, migration_interval=10, migrants=5, topology="ring",
+                 num_workers=None, **options):
+        if topology not in TOPOLOGIES:
+            raise ValueError(f"Unknown migration topology {topology!r}; expected one of {TOPOLOGIES}")
+        if population_size < num_islands:
+            raise ValueError(f"A population of {population_size} cannot fill {num_islands} islands")
+        self.seed = new_root_seed() if seed is None else seed
+        self.grid = (grid_width, grid_height)
+        self.migration_interval = migration_interval
+        self.migrants = migrants
+        self.topology = topology
+        self.options = options
+        self.rng = migration_rng(self.seed)
+        self.generation = 0
+        self.total_moves = 0
+        self.saved_fitness = float("-inf")  # of the brain last written by save_best_brain
+
+        self.populations = []
+        self.states = []
+        self.num_elites = []
+        for island in range(num_islands):
+            island_size = population_size // num_islands + (island < population_size % num_islands)
+            ga = GeneticAlgorithm(population_size=island_size, mutation_rate=mutation_rate,
+                                  seed=island_seed(self.seed, island), dtype=dtype)
+            with contextlib.redirect_stdout(io.StringIO()):
+                self.populations.append(ga.initialize_population())
+            self.states.append(ga_state(ga))
+            self.num_elites.append(ga.num_elites())
+
+        self.pool = ProcessPoolExecutor(max_workers=num_workers or min(num_islands, os.cpu_count()))
+
+    @property
+    def num_islands(self):
+        return len(self.populations)
+
+    def run_epoch(self, generations):
+        # Every island plays `generations` generations in parallel
+        futures = [self.pool.submit(_run_island, population, state, generations, self.grid, self.options)
+                   for population, state in zip(self.populations, self.states)]
+        for island, future in enumerate(futures):
+            population, state, moves = future.result()
+            self.populations[island] = population
+            self.states[island] = state
+            self.total_moves += moves
+        self.generation += generations
+
+    def destinations(self):
+        islands = range(self.num_islands)
+        if self.topology == "ring":
+            return [(island + 1) % self.num_islands for island in islands]
+        # A random permutation without fixed points, so every island
+        # receives exactly one island's migrants
+        while True:
+            destinations = self.rng.permutation(self.num_islands)
+            if (destinations != np.arange(self.num_islands)).all():
+                return destinations.tolist()
+
+    def migrate(self):
+        if self.num_islands < 2:
+            return
+        # Freshly evolved populations start with their elites, best last
+        count = min(self.migrants, *self.num_elites)
+        emigrants = [population[num_elites - count:num_elites].copy()
+                     for population, num_elites in zip(self.populations, self.num_elites)]
+        for source, destination in enumerate(self.destinations()):
+            self.populations[destination][-count:] = emigrants[source]
+
+    def train(self, generations, report_every=1, history_path=None, checkpoint_prefix=None,
+              brain_path=None, checkpoint_dtype=None):
+        # After every epoch (once migrants have arrived) the history, each
+        # island's checkpoint and the best brain are written where given
+        start_time = time.perf_counter()
+        done = 0
+        while done < generations:
+            epoch = min(self.migration_interval, generations - done)
+            epoch_start = time.perf_counter()
+            self.run_epoch(epoch)
+            done += epoch
+            if done < generations:
+                self.migrate()
+
+            if report_every:
+                best = ", ".join(f"{state['best_fitness']:.0f}" for state in self.states)
+                print(f"Generation {self.generation}: {epoch / (time.perf_counter() - epoch_start):.3f} gens/sec, "
+                      f"best fitness per island: {best}")
+            if history_path:
+                self.save_history(history_path)
+            if checkpoint_prefix:
+                self.save_checkpoints(checkpoint_prefix, checkpoint_dtype)
+            if brain_path:
+                self.save_best_brain(brain_path)
+
+        elapsed = time.perf_counter() - start_time
+        print(f"Trained {generations} generations on {self.num_islands} islands in {elapsed:.2f}s "
+              f"({generations / elapsed:.3f} gens/sec, {self.total_moves / elapsed:.0f} moves/sec)")
+
+    def save_history(self, path):
+        # Fitness history of every island, [best, average] per generation
+        history = {
+            "generation": self.generation,
+            "islands": [{"best_fitness": state["best_fitness"], "best_score": state["best_score"],
+                         "fitness_history": state["fitness_history"]} for state in self.states],
+        }
+        atomic_write(path, lambda f: json.dump(history, f), mode="w")
+
+    def save_checkpoints(self, prefix, dtype=None):
+        # One ordinary checkpoint per island, <prefix>_<island>, each of
+        # which `train.py --resume` can continue as a single population
+        for island, (population, state) in enumerate(zip(self.populations, self.states)):
+            write_checkpoint(f"{prefix}_{island}", population, state, dtype)
+        print(f"Island populations saved to {prefix}_0 .. {prefix}_{self.num_islands - 1}")
+
+    def best_individual(self):
+        # (island, genome, fitness) of the island whose latest generation
+        # did best; that generation's best individual is the last of the
+        # island's elites
+        fitness = [state["best_fitness_per_gen"][-1] for state in self.states]
+        island = int(np.argmax(fitness))
+        return island, self.populations[island][self.num_elites[island] - 1], fitness[island]
+
+    def save_best_brain(self, path):
+        # Only replaces the saved brain with one at least as fit, as
+        # SnakeAI.next_generation does
+        island, genome, fitness = self.best_individual()
+        if fitness < self.saved_fitness:
+            return
+        best_brain = tuple(p.copy() for p in unpack_one(genome))
+        atomic_write(path, lambda f: pickle.dump(best_brain, f))
+        self.saved_fitness = fitness
+        print(f"Best brain (island {island}, fitness {fitness:.0f}) saved to {path}")
+
+    def close(self):
+        self.pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
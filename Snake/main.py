@@ -1,10 +1,10 @@
 from genetic import GeneticAlgorithm
 from neural_network import SnakeAI
 from snake import Snake
-from gui import SnakeGameGUI
-import matplotlib
+from replay import ReplayLog, ReplayEngine
+from metrics import Metrics
+import argparse
 import sys
-import pygame
 
 # Constants
 WIDTH = 1200
@@ -14,18 +14,81 @@ GRID_HEIGHT = 30
 BLOCK_SIZE = 20
 FPS = 100
 
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Watch the Snake AI train, or replay a saved brain.")
+    parser.add_argument("--brain", help="replay a saved brain (e.g. best_brain.pkl) instead of training")
+    parser.add_argument("--resume", metavar="CHECKPOINT",
+                        help="continue training from a saved population checkpoint (e.g. population)")
+    parser.add_argument("--replay", metavar="LOG",
+                        help="play back a recorded replay log (e.g. replays/generation_0010.npz)")
+    parser.add_argument("--episode", type=int,
+                        help="episode of the replay log to play (default: highest score)")
+    parser.add_argument("--seed", type=int, help="root seed for the GA and every game's food")
+    parser.add_argument("--grid-width", type=int, default=GRID_WIDTH)
+    parser.add_argument("--grid-height", type=int, default=GRID_HEIGHT)
+    parser.add_argument("--metrics", metavar="PATH",
+                        help="write per-generation timings, counters and fitness stats to a .jsonl or .csv file")
+    parser.add_argument("--profile-generation", type=int, metavar="N",
+                        help="run generation N under cProfile and save the stats")
+    parser.add_argument("--steps-per-frame", type=int, default=1,
+                        help="simulation steps per displayed frame")
+    parser.add_argument("--render-every", type=int, default=1, metavar="N",
+                        help="show every Nth snake at normal speed; the rest run at full speed")
+    parser.add_argument("--render-best", action="store_true",
+                        help="show only last generation's best snake at normal speed")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+
     # Updated population size to 2000 as per description
-    ga = GeneticAlgorithm(population_size=3000, mutation_rate=0.02)
-    snake = Snake(GRID_WIDTH, GRID_HEIGHT)
-    ai = SnakeAI(ga)
+    ga = GeneticAlgorithm(population_size=3000, mutation_rate=0.02, seed=args.seed)
+    metrics = Metrics(args.metrics, profile_generation=args.profile_generation)
+    try:
+        ai = SnakeAI(ga, checkpoint=args.resume, metrics=metrics)
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+    snake = Snake(args.grid_width, args.grid_height, seed=ai.current_food_seed())
+    snake.set_metrics(metrics)
+    
+    if args.brain:
+        ai.replay_brain = ai.load_best_brain(args.brain)
+        if ai.replay_brain is None:
+            print(f"Brain file {args.brain} not found")
+            sys.exit(1)
+    
+    # pygame is only loaded once a window is actually needed
+    import pygame
+    from gui import SnakeGameGUI
+    
+    # Cells shrink so larger boards still fit the game area, the right half
+    # of the window; below one pixel per cell only part of the board shows
+    block_size = min(BLOCK_SIZE, (WIDTH // 2) // args.grid_width, HEIGHT // args.grid_height)
+    if block_size == 0:
+        block_size = 1
+        print(f"A {args.grid_width}x{args.grid_height} board does not fit the {WIDTH // 2}x{HEIGHT} game area; "
+              f"only its top-left part is shown")
+    gui = SnakeGameGUI(snake, ai, ga, width=WIDTH, height=HEIGHT, block_size=block_size)
+    gui.steps_per_frame = max(1, args.steps_per_frame)
+    gui.render_every = max(1, args.render_every)
+    gui.render_best_only = args.render_best
     
-    gui = SnakeGameGUI(snake, ai, ga, width=WIDTH, height=HEIGHT, block_size=BLOCK_SIZE)
+    if args.replay:
+        log = ReplayLog.load(args.replay)
+        episode = log.best_episode() if args.episode is None else args.episode
+        print(f"Replaying episode {episode} of {args.replay} (individual {log.individuals[episode]}, "
+              f"episode {log.episodes[episode]}, score {log.scores[episode]})")
+        gui.play_replay(ReplayEngine(log.episode(episode)))
     
+    metrics.start(ga.generation)
     while gui.running:
         gui.handle_events()
         gui.update()
     
+    ai.close()
+    metrics.close()
+    gui.recorder.wait()
     pygame.quit()
     sys.exit()
 
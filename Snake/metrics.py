@@ -0,0 +1,158 @@
+import numpy as np
+import contextlib
+import csv
+import json
+import threading
+import time
+
+# Phases timed with the monotonic clock. "evaluate" is all game playing of a
+# generation; vision, forward and move are its parts where they can be timed
+# (not inside worker processes).
+PHASES = ("evaluate", "vision", "forward", "move", "evolve", "checkpoint", "render")
+COUNTERS = ("steps", "episodes", "deaths_wall", "deaths_self", "deaths_starvation", "deaths_loop", "wins",
+            "stagnations", "cache_hits", "cache_misses")
+
+# Why a game ended, as Snake.death_cause and BatchSnakeEnv.death_cause codes.
+# "loop" games were stopped early and credited as starved (see snake.py).
+DEATH_CAUSES = ("none", "wall", "self", "starvation", "won", "loop")
+DEATH_COUNTERS = {"wall": "deaths_wall", "self": "deaths_self", "starvation": "deaths_starvation",
+                  "won": "wins", "loop": "deaths_loop"}
+
+_NO_TIMER = contextlib.nullcontext()
+
+class Metrics:
+    # Per-generation timers and counters, written as one record per
+    # generation to a .jsonl or .csv file. Without a path it is disabled:
+    # phase() hands out a shared no-op context and add_time/count return at
+    # once, and Snake/SnakeAI only install their timed methods when enabled.
+    # With profile_generation, that generation runs under cProfile.
+    def __init__(self, path=None, profile_generation=None, profile_path=None):
+        self.path = path
+        self.enabled = path is not None or profile_generation is not None
+        self.profile_generation = profile_generation
+        self.profile_path = profile_path or f"profile_gen{profile_generation}.prof"
+        self.profiler = None
+        self.lock = threading.Lock()
+        self.file = None
+        self.writer = None
+        self._reset()
+
+    def _reset(self):
+        self.times = dict.fromkeys(PHASES, 0.0)
+        self.counts = dict.fromkeys(COUNTERS, 0)
+        self.generation_start = time.perf_counter()
+
+    def phase(self, name):
+        if not self.enabled:
+            return _NO_TIMER
+        return _PhaseTimer(self, name)
+
+    def add_time(self, name, seconds):
+        if self.enabled:
+            with self.lock:
+                self.times[name] += seconds
+
+    def count(self, name, n=1):
+        if self.enabled:
+            self.counts[name] += n
+
+    def count_death(self, cause):
+        if self.enabled and cause in DEATH_COUNTERS:
+            self.counts[DEATH_COUNTERS[cause]] += 1
+            self.counts["episodes"] += 1
+
+    def count_deaths(self, causes):
+        # causes: BatchSnakeEnv.death_cause codes of finished games
+        if not self.enabled:
+            return
+        per_cause = np.bincount(causes, minlength=len(DEATH_CAUSES))
+        for code, cause in enumerate(DEATH_CAUSES):
+            if cause in DEATH_COUNTERS:
+                self.counts[DEATH_COUNTERS[cause]] += int(per_cause[code])
+        self.counts["episodes"] += len(causes)
+
+    def start(self, generation):
+        # Call once before the first generation is played. Counts are kept:
+        # anything counted since the metrics were made (such as the cache
+        # lookups of setting up that generation) belongs to it.
+        self._update_profiler(generation)
+
+    def end_generation(self, generation, fitness_scores, scores):
+        if not self.enabled:
+            return
+        if self.profiler is not None:
+            self._stop_profiler()
+
+        wall_time = time.perf_counter() - self.generation_start
+        fitness_scores = np.asarray(fitness_scores, dtype=np.float64)
+        record = {
+            "generation": generation,
+            "wall_time": wall_time,
+            "steps_per_sec": self.counts["steps"] / wall_time if wall_time > 0 else 0.0,
+        }
+        record.update({f"time_{name}": value for name, value in self.times.items()})
+        record.update(self.counts)
+        percentiles = np.percentile(fitness_scores, [0, 25, 50, 75, 100])
+        record.update({
+            "fitness_min": percentiles[0],
+            "fitness_p25": percentiles[1],
+            "fitness_median": percentiles[2],
+            "fitness_p75": percentiles[3],
+            "fitness_max": percentiles[4],
+            "fitness_mean": fitness_scores.mean(),
+            "fitness_std": fitness_scores.std(),
+            "score_max": int(np.max(scores)),
+            "score_mean": float(np.mean(scores)),
+        })
+        if self.path is not None:
+            self._write(record)
+
+        self._reset()
+        self._update_profiler(generation + 1)
+
+    def _write(self, record):
+        record = {key: float(value) if isinstance(value, np.floating) else value for key, value in record.items()}
+        if self.file is None:
+            self.file = open(self.path, "w", newline="")
+            if self.path.endswith(".csv"):
+                self.writer = csv.DictWriter(self.file, fieldnames=list(record))
+                self.writer.writeheader()
+        if self.writer is not None:
+            self.writer.writerow(record)
+        else:
+            self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+
+    def _update_profiler(self, generation):
+        if generation == self.profile_generation:
+            import cProfile
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def _stop_profiler(self):
+        import pstats
+        self.profiler.disable()
+        self.profiler.dump_stats(self.profile_path)
+        print(f"Profile of generation {self.profile_generation} saved to {self.profile_path}")
+        pstats.Stats(self.profiler).sort_stats("cumulative").print_stats(20)
+        self.profiler = None
+
+    def close(self):
+        if self.profiler is not None:
+            self._stop_profiler()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+class _PhaseTimer:
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.metrics.add_time(self.name, time.perf_counter() - self.start)
+
+DISABLED_METRICS = Metrics()
@@ -1,27 +1,136 @@
 import numpy as np
 import pickle
 import os
+from genome import unpack
+from checkpoint import CheckpointWriter
+from fitness_cache import FitnessCache
+from metrics import DISABLED_METRICS
+import time
+
+def batch_forward(weights, x, indices=None):
+    # Forward pass for N individuals at once: row n of x goes through genome
+    # indices[n] (or genome n). Returns the output layer pre-softmax, which is
+    # all argmax needs.
+    W1, b1, W2, b2, W3, b3 = weights
+    if indices is not None:
+        W1, b1, W2, b2, W3, b3 = (p[indices] for p in weights)
+    
+    # Computed in the genome dtype rather than upcasting every weight
+    x = x.astype(W1.dtype, copy=False)[:, np.newaxis, :]
+    a1 = np.maximum(0, np.matmul(x, W1) + b1[:, np.newaxis, :])
+    a2 = np.maximum(0, np.matmul(a1, W2) + b2[:, np.newaxis, :])
+    z3 = np.matmul(a2, W3) + b3[:, np.newaxis, :]
+    return z3[:, 0, :]
+
+def shared_forward(weights, x):
+    # Forward pass of one genome (W1, b1, ... of a single individual) for
+    # every row of x: plain matrix products, no per-row weight gather.
+    # Returns the output layer pre-softmax, like batch_forward.
+    W1, b1, W2, b2, W3, b3 = weights
+    x = x.astype(W1.dtype, copy=False)
+    a1 = np.maximum(0, x @ W1 + b1)
+    a2 = np.maximum(0, a1 @ W2 + b2)
+    return a2 @ W3 + b3
+
+def episode_fitness(scores, moves_used):
+    # Fitness of single games: survival time, plus a bonus that doubles with
+    # every food eaten
+    scores = np.asarray(scores)
+    return np.where(scores == 0, moves_used, moves_used + (2.0 ** scores) * 1000)
+
+def selection_ranks(fitness, rounds):
+    # Dense ranks ordering individuals by rounds played, then fitness: one
+    # eliminated in an earlier round never outranks one that went further.
+    # Equal (rounds, fitness) pairs share a rank, so with equal rounds the
+    # ranks order exactly like the fitness.
+    order = np.lexsort((fitness, rounds))
+    fitness = fitness[order]
+    rounds = rounds[order]
+    new_rank = np.ones(len(order), dtype=bool)
+    new_rank[1:] = (fitness[1:] != fitness[:-1]) | (rounds[1:] != rounds[:-1])
+    ranks = np.empty(len(order))
+    ranks[order] = np.cumsum(new_rank)
+    return ranks
+
+FITNESS_AGGREGATES = {"mean": np.nanmean, "median": np.nanmedian, "min": np.nanmin}
 
 class SnakeAI:
-    def __init__(self, ga):
+    # Each individual plays up to `episodes` games per generation and its
+    # fitness is the `aggregate` of their episode fitnesses. Games are played
+    # in rounds: everyone plays episode 0, then only the best keep_fraction of
+    # the previous round that have eaten at least once play the next episode,
+    # successive-halving style, so hopeless genomes cost one game. With
+    # fitness_cache > 0, games whose (genome, food seed) result is cached are
+    # not played again. A given population is played as is, for a GA that
+    # already holds its state (see GeneticAlgorithm.from_state). metrics are
+    # installed before generation 0 is set up, so its cache lookups count.
+    def __init__(self, ga, checkpoint=None, episodes=1, aggregate="mean", keep_fraction=0.5, checkpoint_every=5,
+                 fitness_cache=0, population=None, metrics=DISABLED_METRICS):
         self.ga = ga
-        self.population = self.ga.initialize_population()
-        self.current_snake_idx = 0
-        self.best_score = 0
-        self.fitness_scores = [0] * self.ga.population_size
+        if population is None:
+            population = self.ga.initialize_population(checkpoint)
+        self.set_population(population)
+        self.episodes = episodes
+        self.aggregate = FITNESS_AGGREGATES[aggregate]
+        self.keep_fraction = keep_fraction
+        self.checkpoint_every = checkpoint_every  # generations; 0 disables
+        self.best_score = self.ga.best_score
+        self.fitness_cache = FitnessCache(fitness_cache) if fitness_cache else None
         self.current_weights = None
+        self._weights_source = None
+        self._weights_idx = None
         self.vision_values = None
         self.last_output = None
+        self.replay_brain = None
+        self.checkpoint_writer = CheckpointWriter() if checkpoint_every else None
+        self.set_metrics(metrics)
+        self.start_generation()
+        
+    def set_metrics(self, metrics):
+        # Shared with the GA; get_move is only timed while metrics are enabled
+        self.metrics = metrics
+        self.ga.metrics = metrics
+        if metrics.enabled:
+            self.get_move = self._timed_get_move
+        else:
+            try:
+                del self.get_move
+            except AttributeError:
+                pass
+        
+    def _timed_get_move(self, vision_input):
+        start = time.perf_counter()
+        move = SnakeAI.get_move(self, vision_input)
+        self.metrics.add_time("forward", time.perf_counter() - start)
+        return move
         
     def get_move(self, vision_input):
-        self.current_weights = self.population[self.current_snake_idx]
+        if self.replay_brain is not None:
+            self.current_weights = self.replay_brain
+        elif self._weights_source is not self.population or self._weights_idx != self.current_snake_idx:
+            # current_weights stays the same object while the same snake plays,
+            # so the GUI can tell when to redraw the network
+            self.current_weights = self.get_weights(self.current_snake_idx)
+            self._weights_source = self.population
+            self._weights_idx = self.current_snake_idx
         self.vision_values = vision_input
         output = self._forward(vision_input, self.current_weights)
         self.last_output = output
         return np.argmax(output)
     
+    def set_population(self, population):
+        # population is the GA's (N, GENOME_SIZE) genome matrix; weights are
+        # stacked (N, ...) views of it, one per parameter
+        self.population = population
+        self.weights = unpack(population)
+    
+    def get_weights(self, idx):
+        # W1, b1, W2, b2, W3, b3 of one individual, as views into the population
+        return tuple(p[idx] for p in self.weights)
+    
     def _forward(self, x, weights):
         W1, b1, W2, b2, W3, b3 = weights
+        x = np.asarray(x, dtype=W1.dtype)
         
         # Input to first hidden layer (24 -> 16)
         z1 = np.dot(x, W1) + b1
@@ -40,44 +149,162 @@ class SnakeAI:
         
         return output
     
+    def start_generation(self):
+        n = self.ga.population_size
+        self.episode_fitness = np.full((n, self.episodes), np.nan)
+        self.episode_scores = np.zeros((n, self.episodes), dtype=np.int64)
+        self.fitness_scores = np.zeros(n)
+        self.current_episode = 0
+        self.current_snake_idx = 0
+        self.genome_digests = None
+        if self.fitness_cache is not None:
+            self.genome_digests = [FitnessCache.digest(genome) for genome in self.population]
+        self.start_round(np.arange(n))
+    
+    def start_round(self, members):
+        # members play the current episode. Those whose game is in the
+        # fitness cache get its result straight away, and only the rest are
+        # left in round_individuals to play. False if none are left.
+        self.round_members = members
+        self.round_individuals = members
+        self.round_keys = None
+        if self.fitness_cache is not None:
+            self.round_individuals = self._apply_cache(members)
+        self.round_pos = 0
+        if len(self.round_individuals) == 0:
+            return False
+        self.current_snake_idx = int(self.round_individuals[0])
+        return True
+    
+    def round_answered(self):
+        # True when the fitness cache answered every game of the current
+        # round; the caller then finishes it without playing
+        return len(self.round_individuals) == 0
+    
+    def _apply_cache(self, members):
+        seeds = self.ga.food_seeds(members, self.current_episode)
+        keys = [(self.genome_digests[i], int(seed)) for i, seed in zip(members, seeds)]
+        results = [self.fitness_cache.get(key) for key in keys]
+        hit = np.array([result is not None for result in results], dtype=bool)
+        self.metrics.count("cache_hits", int(hit.sum()))
+        self.metrics.count("cache_misses", int((~hit).sum()))
+        if hit.any():
+            scores, moves_left = np.array([result for result in results if result is not None]).T
+            self._record(members[hit], scores, moves_left)
+        
+        # Keys of the games still to play, to store their results
+        self.round_keys = {int(i): key for i, key, cached in zip(members, keys, hit) if not cached}
+        return members[~hit]
+    
+    def _cache_results(self, individuals, scores, moves_used):
+        if self.round_keys is None:
+            return
+        for i, score, moves in zip(individuals, scores, moves_used):
+            self.fitness_cache.put(self.round_keys[int(i)], (int(score), int(moves)))
+    
+    def current_food_seed(self):
+        return self.ga.food_seed(self.current_snake_idx, self.current_episode)
+    
+    def round_food_seeds(self):
+        return self.ga.food_seeds(self.round_individuals, self.current_episode)
+    
+    def round_policy(self):
+        # Batched get_move for the individuals of the current round, with
+        # their weights gathered once rather than on every step
+        weights = tuple(p[self.round_individuals] for p in self.weights)
+        return lambda vision_batch: np.argmax(batch_forward(weights, vision_batch), axis=1)
+    
+    def _record(self, individuals, scores, moves_used):
+        scores = np.asarray(scores)
+        self.episode_fitness[individuals, self.current_episode] = episode_fitness(scores, np.asarray(moves_used))
+        self.episode_scores[individuals, self.current_episode] = scores
+        self.fitness_scores[individuals] = self.aggregate(self.episode_fitness[individuals], axis=1)
+        
+        if scores.max() > self.best_score:
+            self.best_score = int(scores.max())
+            self.ga.best_score = self.best_score
+    
     def update_fitness(self, score, moves_used):
-        # Calculate fitness based on score and survival time
-        if score == 0:
-            fitness = moves_used
+        # Result of the game the current snake just played
+        self._record([self.current_snake_idx], [score], [moves_used])
+        self._cache_results([self.current_snake_idx], [score], [moves_used])
+        
+        self.round_pos += 1
+        if self.round_pos < len(self.round_individuals):
+            self.current_snake_idx = int(self.round_individuals[self.round_pos])
         else:
-            fitness = moves_used + (2 ** score) * 1000
+            self.finish_round()
+
+    def update_population_fitness(self, scores, moves_used):
+        # Same as update_fitness, for the whole round evaluated at once
+        self._record(self.round_individuals, scores, moves_used)
+        self._cache_results(self.round_individuals, scores, moves_used)
+        self.finish_round()
+    
+    def finish_round(self):
+        # Later rounds of the generation that the fitness cache answers
+        # completely are finished here too; a generation whose first round
+        # it answers is left to the caller (see round_answered)
+        while True:
+            self.current_episode += 1
             
-        self.fitness_scores[self.current_snake_idx] = fitness
-        
-        if score > self.best_score:
-            self.best_score = score
-            self.ga.best_score = score
+            survivors = self.round_members
+            survivors = survivors[self.episode_scores[survivors].max(axis=1) > 0]
+            keep = int(np.ceil(len(survivors) * self.keep_fraction))
+            if self.current_episode >= self.episodes or keep == 0:
+                self.next_generation()
+                return
             
-        self.current_snake_idx += 1
+            ranked = survivors[np.argsort(-self.fitness_scores[survivors], kind="stable")]
+            if self.start_round(np.sort(ranked[:keep])):
+                return
+
+    def selection_scores(self):
+        # Racing only promotes the best of a round, so an individual's
+        # aggregate over more episodes is not comparable with one over fewer
+        # (min only goes down with more games). Selection ranks by episodes
+        # played first, fitness second.
+        rounds = np.sum(~np.isnan(self.episode_fitness), axis=1)
+        return selection_ranks(self.fitness_scores, rounds)
+    
+    def next_generation(self):
+        print(f"Generation {self.ga.generation} complete")
+        print(f"Best Score: {self.best_score}")
+        print(f"Best Fitness: {max(self.fitness_scores)}")
+        if self.fitness_cache is not None:
+            print(f"Fitness cache: {self.fitness_cache.hit_rate():.1%} hits, {len(self.fitness_cache)} entries")
+        
+        selection_scores = self.selection_scores()
+        best_idx = np.argmax(selection_scores)
+        best_fitness = self.fitness_scores[best_idx]
+        best_brain = tuple(p.copy() for p in self.get_weights(best_idx))
+        
+        generation = self.ga.generation
+        self.set_population(self.ga.evolve(self.population, self.fitness_scores, selection_scores))
+        if self.checkpoint_every and self.ga.generation % self.checkpoint_every == 0:
+            # Written in the background while the next generation plays
+            if best_fitness < self.ga.best_fitness:
+                best_brain = None
+            with self.metrics.phase("checkpoint"):
+                self.checkpoint_writer.submit(self.population, self.ga, best_brain, best_fitness)
         
-        if self.current_snake_idx >= self.ga.population_size:
-            print(f"Generation {self.ga.generation} complete")
-            print(f"Best Score: {self.best_score}")
-            print(f"Best Fitness: {max(self.fitness_scores)}")
+        self.metrics.end_generation(generation, self.fitness_scores, self.episode_scores.max(axis=1))
+        self.start_generation()
             
-            self.population = self.ga.evolve(self.population, self.fitness_scores)
-            if self.ga.generation % 5 == 0:
-                self.ga.save_population(self.population)
-                self.ga.save_best_snake(self.population, self.fitness_scores)
-                self.ga.plot_fitness_history()
-                
-            self.current_snake_idx = 0
-            self.fitness_scores = [0] * self.ga.population_size
+    def close(self):
+        # Waits for pending checkpoints to be written
+        if self.checkpoint_writer is not None:
+            self.checkpoint_writer.close()
             
     def save_best_brain(self):
-        best_idx = np.argmax(self.fitness_scores)
-        best_brain = self.population[best_idx]
+        best_idx = np.argmax(self.selection_scores())
+        best_brain = tuple(p.copy() for p in self.get_weights(best_idx))
         with open('best_brain.pkl', 'wb') as f:
             pickle.dump(best_brain, f)
         print("Best brain saved successfully!")
             
-    def load_best_brain(self):
-        if os.path.exists('best_brain.pkl'):
-            with open('best_brain.pkl', 'rb') as f:
+    def load_best_brain(self, filename='best_brain.pkl'):
+        if os.path.exists(filename):
+            with open(filename, 'rb') as f:
                 return pickle.load(f)
         return None
\ No newline at end of file
@@ -0,0 +1,93 @@
+from batch_env import BatchSnakeEnv
+from neural_network import batch_forward
+from genome import unpack
+from replay import ReplayLog
+from seeding import new_root_seed, next_game_seed
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import os
+
+# Per-process state of a pool worker, set up once by _init_worker
+_worker = {}
+
+def _init_worker(shm_name, shape, dtype, grid_width, grid_height):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    _worker["shm"] = shm
+    _worker["genomes"] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    _worker["grid"] = (grid_width, grid_height)
+
+def _evaluate_shard(start, individuals, seeds, record=False, episode=-1):
+    weights = unpack(_worker["genomes"][individuals])
+    env = BatchSnakeEnv(len(individuals), *_worker["grid"])
+    moves = env.play(lambda vision: np.argmax(batch_forward(weights, vision), axis=1), seeds=seeds)
+    log = None
+    if record:
+        log = ReplayLog(*_worker["grid"])
+        log.add_batch(env, individuals, episode)
+    return start, env.score, env.moves_left, moves, env.death_cause, log
+
+class ParallelEvaluator:
+    # Evaluates a population across a persistent pool of worker processes.
+    # The genome matrix is copied on every evaluate call into a shared memory
+    # block the workers map at startup, so tasks only carry indices and seeds.
+    def __init__(self, population, grid_width, grid_height, num_workers=None):
+        self.population_size = len(population)
+        self.num_workers = num_workers or os.cpu_count()
+        self.grid = (grid_width, grid_height)
+        self.moves = 0
+        self.death_causes = None
+        self.replay_log = None
+
+        self.shm = shared_memory.SharedMemory(create=True, size=population.nbytes)
+        self.genomes = np.ndarray(population.shape, dtype=population.dtype, buffer=self.shm.buf)
+
+        self.pool = ProcessPoolExecutor(
+            max_workers=self.num_workers,
+            initializer=_init_worker,
+            initargs=(self.shm.name, population.shape, population.dtype, grid_width, grid_height),
+        )
+
+    def evaluate(self, population, seeds=None, record=False, indices=None, episode=-1):
+        # Plays one game for each individual in indices (default: everyone)
+        # and returns (scores, moves_left) in that order. Game k uses food
+        # seed seeds[k], so results do not depend on the number of workers.
+        # With record, replay_log holds every episode afterwards, each
+        # tagged with its individual and the given episode number.
+        np.copyto(self.genomes, population)
+        if indices is None:
+            indices = np.arange(self.population_size)
+        if seeds is None:
+            root = new_root_seed()
+            seeds = np.array([next_game_seed(root, game) for game in range(len(indices))], dtype=np.uint64)
+
+        bounds = np.linspace(0, len(indices), self.num_workers + 1).astype(int)
+        futures = [self.pool.submit(_evaluate_shard, start, indices[start:stop], seeds[start:stop],
+                                    record, episode)
+                   for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+
+        scores = np.zeros(len(indices), dtype=np.int64)
+        moves_left = np.zeros(len(indices), dtype=np.int64)
+        self.death_causes = np.zeros(len(indices), dtype=np.int64)
+        self.replay_log = ReplayLog(*self.grid) if record else None
+        for future in futures:
+            start, shard_scores, shard_moves_left, moves, death_causes, log = future.result()
+            scores[start:start + len(shard_scores)] = shard_scores
+            moves_left[start:start + len(shard_moves_left)] = shard_moves_left
+            self.death_causes[start:start + len(death_causes)] = death_causes
+            self.moves += moves
+            if record:
+                self.replay_log.extend(log)
+        return scores, moves_left
+
+    def close(self):
+        self.pool.shutdown()
+        self.genomes = None
+        self.shm.close()
+        self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
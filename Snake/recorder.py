@@ -0,0 +1,84 @@
+import pygame
+import numpy as np
+import threading
+
+class GifRecorder:
+    # Keeps the last `capacity` frames in a preallocated ring buffer of
+    # downscaled uint8 frames. Frames are read straight from the surface
+    # pixels, and GIFs are encoded on a background thread.
+    def __init__(self, capacity=200, scale=2):
+        self.capacity = capacity
+        self.scale = scale
+        self.frames = None
+        self.count = 0
+        self.next_slot = 0
+        self.armed = False
+        self.encoders = []
+
+    def arm(self):
+        self.armed = True
+        self.clear()
+        print("GIF recording armed")
+
+    def disarm(self):
+        self.armed = False
+        print("GIF recording stopped")
+
+    def toggle(self):
+        if self.armed:
+            self.disarm()
+        else:
+            self.arm()
+
+    def clear(self):
+        self.count = 0
+        self.next_slot = 0
+
+    def capture(self, surface):
+        if not self.armed:
+            return
+
+        # pixels3d is a (width, height, 3) view of the surface, no copy
+        pixels = pygame.surfarray.pixels3d(surface)
+        frame = pixels[::self.scale, ::self.scale].transpose(1, 0, 2)
+        if self.frames is None or self.frames.shape[1:] != frame.shape:
+            self.frames = np.empty((self.capacity,) + frame.shape, dtype=np.uint8)
+            self.clear()
+
+        self.frames[self.next_slot] = frame
+        del pixels  # releases the surface lock
+        self.next_slot = (self.next_slot + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def get_frames(self):
+        # Copy of the buffered frames, oldest first
+        if self.count < self.capacity:
+            return self.frames[:self.count].copy()
+        return np.concatenate([self.frames[self.next_slot:], self.frames[:self.next_slot]])
+
+    def save(self, filename="snake_game.gif", duration=0.1):
+        if not self.count:
+            print("No frames to save.")
+            return None
+
+        frames = self.get_frames()
+        self.clear()
+        encoder = threading.Thread(target=self._encode, args=(frames, filename, duration),
+                                   name="gif-encoder", daemon=True)
+        encoder.start()
+        self.encoders = [t for t in self.encoders if t.is_alive()] + [encoder]
+        return encoder
+
+    def _encode(self, frames, filename, duration):
+        try:
+            import imageio  # only needed once a GIF is written
+            imageio.mimsave(filename, list(frames), duration=duration)
+            print(f"GIF saved to {filename}")
+        except Exception as e:
+            print(f"Error saving GIF: {e}")
+
+    def wait(self):
+        # Blocks until every pending GIF is written
+        for encoder in self.encoders:
+            encoder.join()
+        self.encoders = []
@@ -0,0 +1,172 @@
+import numpy as np
+from snake import Snake, Direction
+from checkpoint import atomic_write
+
+# An episode is fully determined by the board size, the food seed and the
+# direction taken at every move: the start position is fixed (Snake.reset)
+# and food comes from the seeded generator. Directions take 2 bits, so four
+# moves pack into one byte. Version 2 picks food in board order among the
+# empty cells (snake.nth_free_cell), so version 1 logs no longer replay.
+# Version 3 adds the individual and episode number of each game; version 2
+# logs load with both unknown (-1).
+REPLAY_VERSION = 3
+SUPPORTED_REPLAY_VERSIONS = (2, 3)
+
+def pack_actions(actions):
+    actions = np.asarray(actions, dtype=np.uint8)
+    padded = np.zeros(-(-len(actions) // 4) * 4, dtype=np.uint8)
+    padded[:len(actions)] = actions
+    quads = padded.reshape(-1, 4)
+    return quads[:, 0] | (quads[:, 1] << 2) | (quads[:, 2] << 4) | (quads[:, 3] << 6)
+
+def unpack_actions(packed, num_steps):
+    packed = np.asarray(packed, dtype=np.uint8)
+    shifts = np.array([0, 2, 4, 6], dtype=np.uint8)
+    return ((packed[:, np.newaxis] >> shifts) & 3).ravel()[:num_steps]
+
+class ReplayLog:
+    # Many episodes on one board, stored as flat arrays: seed, move count,
+    # score, individual and episode number per episode plus one buffer of
+    # packed actions. Episode i's actions start at byte offsets[i]. The
+    # individual and episode number are -1 where unknown.
+    def __init__(self, grid_width, grid_height):
+        self.grid_width = grid_width
+        self.grid_height = grid_height
+        self.seeds = []
+        self.num_steps = []
+        self.scores = []
+        self.individuals = []
+        self.episodes = []
+        self.chunks = []
+
+    def __len__(self):
+        return len(self.seeds)
+
+    def add(self, seed, actions, score, individual=-1, episode=-1):
+        self.seeds.append(int(seed))
+        self.num_steps.append(len(actions))
+        self.scores.append(int(score))
+        self.individuals.append(int(individual))
+        self.episodes.append(int(episode))
+        self.chunks.append(pack_actions(actions))
+
+    def add_snake(self, snake, individual=-1, episode=-1):
+        self.add(snake.seed, np.frombuffer(bytes(snake.actions), dtype=np.uint8), snake.score, individual, episode)
+
+    def add_batch(self, env, individuals=None, episode=-1):
+        # One episode per game of a finished BatchSnakeEnv, game k played by
+        # individuals[k]
+        if individuals is None:
+            individuals = np.full(env.num_games, -1)
+        history = np.stack(env.action_history) if env.action_history else np.zeros((0, env.num_games), dtype=np.uint8)
+        for game in range(env.num_games):
+            self.add(env.seeds[game], history[:env.num_moves[game], game], env.score[game],
+                     individuals[game], episode)
+
+    def extend(self, other):
+        self.seeds.extend(other.seeds)
+        self.num_steps.extend(other.num_steps)
+        self.scores.extend(other.scores)
+        self.individuals.extend(other.individuals)
+        self.episodes.extend(other.episodes)
+        self.chunks.extend(other.chunks)
+
+    def offsets(self):
+        sizes = [len(chunk) for chunk in self.chunks]
+        return np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+
+    def episode(self, i):
+        return {
+            "grid_width": self.grid_width,
+            "grid_height": self.grid_height,
+            "seed": self.seeds[i],
+            "num_steps": self.num_steps[i],
+            "score": self.scores[i],
+            "individual": self.individuals[i],
+            "episode": self.episodes[i],
+            "actions": self.chunks[i],
+        }
+
+    def best_episode(self):
+        return int(np.argmax(self.scores))
+
+    def save(self, path):
+        arrays = {
+            "version": np.array(REPLAY_VERSION),
+            "grid": np.array([self.grid_width, self.grid_height], dtype=np.int64),
+            "seeds": np.array(self.seeds, dtype=np.uint64),
+            "num_steps": np.array(self.num_steps, dtype=np.int64),
+            "scores": np.array(self.scores, dtype=np.int64),
+            "individuals": np.array(self.individuals, dtype=np.int64),
+            "episodes": np.array(self.episodes, dtype=np.int64),
+            "offsets": self.offsets(),
+            "actions": np.concatenate(self.chunks) if self.chunks else np.zeros(0, dtype=np.uint8),
+        }
+        atomic_write(path, lambda f: np.savez_compressed(f, **arrays))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            version = int(data["version"])
+            if version not in SUPPORTED_REPLAY_VERSIONS:
+                raise ValueError(f"Unsupported replay version in {path}: {int(data['version'])}")
+            grid_width, grid_height = data["grid"].tolist()
+            log = cls(grid_width, grid_height)
+            log.seeds = data["seeds"].tolist()
+            log.num_steps = data["num_steps"].tolist()
+            log.scores = data["scores"].tolist()
+            if version >= 3:
+                log.individuals = data["individuals"].tolist()
+                log.episodes = data["episodes"].tolist()
+            else:
+                log.individuals = [-1] * len(log.seeds)
+                log.episodes = [-1] * len(log.seeds)
+            offsets = data["offsets"]
+            actions = data["actions"]
+            log.chunks = [actions[start:stop] for start, stop in zip(offsets[:-1], offsets[1:])]
+        return log
+
+class ReplayEngine:
+    # Plays an episode back by feeding its actions to a Snake with the same
+    # seed; no network is evaluated. Frame 0 is the start position and frame
+    # i the board after i moves. A snapshot every keyframe_interval frames
+    # lets seek() jump anywhere by replaying at most that many moves.
+    def __init__(self, episode, keyframe_interval=100):
+        self.episode = episode
+        self.num_steps = episode["num_steps"]
+        self.actions = unpack_actions(episode["actions"], self.num_steps)
+        self.keyframe_interval = keyframe_interval
+        self.snake = Snake(episode["grid_width"], episode["grid_height"], seed=episode["seed"])
+
+        self.keyframes = []
+        self.frame = 0
+        while True:
+            if self.frame % keyframe_interval == 0:
+                self.keyframes.append(self.snake.get_state())
+            if not self.step():
+                break
+        if self.snake.score != episode["score"]:
+            raise ValueError(f"Replay diverged: scored {self.snake.score}, recorded {episode['score']}")
+        self.seek(0)
+
+    @property
+    def num_frames(self):
+        return self.num_steps + 1
+
+    def step(self):
+        # Advances one move; False once the episode is over
+        if self.frame >= self.num_steps:
+            return False
+        self.snake.change_direction(Direction(int(self.actions[self.frame])))
+        self.snake.move()
+        self.frame += 1
+        return True
+
+    def seek(self, frame):
+        frame = max(0, min(frame, self.num_steps))
+        keyframe = frame // self.keyframe_interval
+        self.snake.set_state(self.keyframes[keyframe])
+        self.frame = keyframe * self.keyframe_interval
+        while self.frame < frame:
+            self.step()
+        return self.snake
@@ -0,0 +1,51 @@
+import numpy as np
+
+# Every random number of a run derives from one root seed through
+# SeedSequence spawn keys, so no stream depends on who draws from it first:
+#   (GA_STREAM,)                               GA operators
+#   (ISLAND_STREAM, island)                    root seed of an island's own GA
+#   (MIGRATION_STREAM,)                        random migration topology
+#   (FOOD_STREAM, generation, individual, episode)
+#                                              food of one of that individual's games
+#   (SHARED_FOOD_STREAM, episode)              food of everyone's game number episode,
+#                                              in every generation (shared seeds)
+# Games reset without a seed take the next seed of their own stream instead,
+# rooted at the previous game's seed:
+#   (NEXT_GAME_STREAM, game)                   food of game number game of a batch
+GA_STREAM = 0
+FOOD_STREAM = 1
+ISLAND_STREAM = 2
+MIGRATION_STREAM = 3
+SHARED_FOOD_STREAM = 4
+NEXT_GAME_STREAM = 5
+
+def new_root_seed():
+    return np.random.SeedSequence().entropy
+
+def ga_rng(root_seed):
+    return np.random.default_rng(np.random.SeedSequence(root_seed, spawn_key=(GA_STREAM,)))
+
+def food_seed(root_seed, generation, individual, episode=0):
+    # A plain 64-bit integer, so replay logs can store it
+    sequence = np.random.SeedSequence(root_seed, spawn_key=(FOOD_STREAM, generation, int(individual), episode))
+    return int(sequence.generate_state(1, np.uint64)[0])
+
+def food_seeds(root_seed, generation, individuals, episode=0):
+    return np.array([food_seed(root_seed, generation, i, episode) for i in individuals], dtype=np.uint64)
+
+def shared_food_seed(root_seed, episode=0):
+    sequence = np.random.SeedSequence(root_seed, spawn_key=(SHARED_FOOD_STREAM, episode))
+    return int(sequence.generate_state(1, np.uint64)[0])
+
+def next_game_seed(seed, game=0):
+    # Only the first of a run of unseeded games needs a fresh root seed
+    sequence = np.random.SeedSequence(int(seed), spawn_key=(NEXT_GAME_STREAM, game))
+    return int(sequence.generate_state(1, np.uint64)[0])
+
+def island_seed(root_seed, island):
+    # A 128-bit integer; islands run as independent GAs rooted here
+    words = np.random.SeedSequence(root_seed, spawn_key=(ISLAND_STREAM, island)).generate_state(2, np.uint64)
+    return int(words[0]) << 64 | int(words[1])
+
+def migration_rng(root_seed):
+    return np.random.default_rng(np.random.SeedSequence(root_seed, spawn_key=(MIGRATION_STREAM,)))
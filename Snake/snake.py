@@ -1,5 +1,10 @@
 import numpy as np
+from collections import deque
 from enum import Enum
+from vision import BodyIndex, get_vision_tables
+from metrics import DISABLED_METRICS
+from seeding import new_root_seed, next_game_seed
+import time
 
 class Direction(Enum):
     UP = 0
@@ -7,29 +12,158 @@ class Direction(Enum):
     DOWN = 2
     LEFT = 3
 
+# Loop detection. With the food where it is, the game's future depends only
+# on the body and direction, so a snake that is in the same body and
+# direction twice without eating in between will go round that loop until
+# it starves. The body is the last len(body) cells the head went through
+# (the path), so each state is hashed with a rolling polynomial hash of that
+# window, salted by direction. Brent's cycle detection compares every state
+# with one saved state, saved again after 1, 2, 4, ... moves, so a loop is
+# found within a few laps at O(1) cost per move; equal hashes are confirmed
+# by comparing the two windows.
+LOOP_HASH_BASE = 0x100000001B3
+LOOP_HASH_MASK = (1 << 64) - 1
+DIRECTION_SALTS = (0x9E3779B97F4A7C15, 0xBF58476D1CE4E5B9, 0x94D049BB133111EB, 0xD6E8FEB86659FD93)
+STARVATION_MOVES = 200
+
+def nth_free_cell(occupied, n):
+    # The n-th empty cell (y * grid_width + x) in board order, given the
+    # sorted occupied cells. occupied[i] - i empty cells lie before
+    # occupied[i], so no per-cell free list has to be kept up to date.
+    return int(n) + int(np.searchsorted(occupied - np.arange(len(occupied)), n, side="right"))
+
 class Snake:
-    def __init__(self, grid_width, grid_height):
-        self.grid_width = grid_width
-        self.grid_height = grid_height
-        self.reset()
+    # With detect_loops off, looping snakes play on until they starve (see
+    # benchmark.py --check-loops)
+    detect_loops = True
+    
+    def __init__(self, grid_width, grid_height, seed=None):
+        # Plain ints: the loop hash is big-int arithmetic, which overflows if
+        # NumPy ints (e.g. sizes read from a replay .npz) creep into it
+        self.grid_width = int(grid_width)
+        self.grid_height = int(grid_height)
+        self.vision_tables = get_vision_tables(grid_width, grid_height)
+        self.set_metrics(DISABLED_METRICS)
+        self.seed = None
+        self.reset(seed)
+        
+    def reset(self, seed=None):
+        # Food comes from a per-game generator, so a game is fully determined
+        # by its seed and the directions it was given (see replay.py). Without
+        # a seed, the game follows on from the previous one (seeding.py).
+        if seed is None:
+            seed = next_game_seed(new_root_seed() if self.seed is None else self.seed)
+        self.seed = int(seed)
+        self.rng = np.random.default_rng(self.seed)
+        self.actions = bytearray()
         
-    def reset(self):
         middle_x = self.grid_width // 2
         middle_y = self.grid_height // 2
-        self.body = [(middle_x, middle_y), (middle_x, middle_y+1), (middle_x, middle_y+2)]
         self.direction = Direction.UP
+        self.set_body([(middle_x, middle_y), (middle_x, middle_y+1), (middle_x, middle_y+2)])
         self.food = self._spawn_food()
         self.score = 0
         self.moves_left = 200
         self.moves_without_food = 0
         self.dead = False
+        self.won = False
+        self.death_cause = "none"
+        
+    def set_metrics(self, metrics):
+        # Timed versions of move and get_vision replace the plain ones only
+        # while metrics are enabled, so disabled metrics cost nothing per step
+        self.metrics = metrics
+        if metrics.enabled:
+            self.move = self._timed_move
+            self.get_vision = self._timed_get_vision
+        else:
+            try:
+                del self.move
+                del self.get_vision
+            except AttributeError:
+                pass
+        
+    def set_body(self, body):
+        # The body is a deque (head first) mirrored by a set of its cells, so
+        # collision checks don't scan the body, and by a BodyIndex for the
+        # vision rays. Neither grows with the board.
+        self.body = deque(body)
+        self.cells = set(self.body)
+        self.body_index = BodyIndex(self.body)
+        self.start_loop_check()
+        
+    def start_loop_check(self):
+        # Forgets the states seen so far; called whenever the snake eats
+        self.path = [y * self.grid_width + x for x, y in reversed(self.body)]
+        loop_hash = 0
+        for cell in self.path:
+            loop_hash = (loop_hash * LOOP_HASH_BASE + cell + 1) & LOOP_HASH_MASK
+        self.loop_hash = loop_hash
+        self.loop_power = pow(LOOP_HASH_BASE, len(self.path), LOOP_HASH_MASK + 1)
+        self._save_state(1)
+        
+    def _save_state(self, span):
+        # The saved state is compared with the next `span` states
+        self.saved_key = self.loop_hash ^ DIRECTION_SALTS[self.direction.value]
+        self.saved_length = len(self.path)
+        self.loop_span = span
+        self.since_saved = 0
+        
+    def _same_body_as_saved(self):
+        length = len(self.body)
+        return self.path[self.saved_length - length:self.saved_length] == self.path[-length:]
         
     def _spawn_food(self):
-        while True:
-            x = np.random.randint(0, self.grid_width)
-            y = np.random.randint(0, self.grid_height)
-            if (x, y) not in self.body:
-                return (x, y)
+        # One uniform pick among the empty cells; None once the board is full
+        num_free = self.grid_width * self.grid_height - len(self.body)
+        if num_free == 0:
+            return None
+        occupied = np.sort([y * self.grid_width + x for x, y in self.cells])
+        cell = nth_free_cell(occupied, self.rng.integers(num_free))
+        return (cell % self.grid_width, cell // self.grid_width)
+    
+    def get_state(self):
+        # Snapshot of everything move() reads or changes
+        return {
+            "body": list(self.body),
+            "direction": self.direction,
+            "food": self.food,
+            "score": self.score,
+            "moves_left": self.moves_left,
+            "moves_without_food": self.moves_without_food,
+            "dead": self.dead,
+            "won": self.won,
+            "death_cause": self.death_cause,
+            "rng": self.rng.bit_generator.state,
+            "actions": bytes(self.actions),
+            "path": list(self.path),
+            "loop_hash": self.loop_hash,
+            "loop_power": self.loop_power,
+            "saved_key": self.saved_key,
+            "saved_length": self.saved_length,
+            "loop_span": self.loop_span,
+            "since_saved": self.since_saved,
+        }
+        
+    def set_state(self, state):
+        self.set_body(state["body"])
+        self.direction = state["direction"]
+        self.food = state["food"]
+        self.score = state["score"]
+        self.moves_left = state["moves_left"]
+        self.moves_without_food = state["moves_without_food"]
+        self.dead = state["dead"]
+        self.won = state["won"]
+        self.death_cause = state["death_cause"]
+        self.rng.bit_generator.state = state["rng"]
+        self.actions = bytearray(state["actions"])
+        self.path = list(state["path"])
+        self.loop_hash = state["loop_hash"]
+        self.loop_power = state["loop_power"]
+        self.saved_key = state["saved_key"]
+        self.saved_length = state["saved_length"]
+        self.loop_span = state["loop_span"]
+        self.since_saved = state["since_saved"]
     
     def change_direction(self, new_direction):
         if (new_direction == Direction.UP and self.direction != Direction.DOWN) or \
@@ -42,11 +176,13 @@ class Snake:
         if self.dead:
             return False
             
+        self.actions.append(self.direction.value)
         self.moves_left -= 1
         self.moves_without_food += 1
         
-        if self.moves_without_food >= 200:
+        if self.moves_without_food >= STARVATION_MOVES:
             self.dead = True
+            self.death_cause = "starvation"
             return False
             
         head_x, head_y = self.body[0]
@@ -64,14 +200,18 @@ class Snake:
         if (new_head[0] < 0 or new_head[0] >= self.grid_width or 
             new_head[1] < 0 or new_head[1] >= self.grid_height):
             self.dead = True
+            self.death_cause = "wall"
             return False
             
         # Check for self-collision
-        if new_head in self.body:
+        if new_head in self.cells:
             self.dead = True
+            self.death_cause = "self"
             return False
             
-        self.body.insert(0, new_head)
+        self.body.appendleft(new_head)
+        self.cells.add(new_head)
+        self.body_index.add(new_head[0], new_head[1])
         
         # Check if the snake ate the food
         if new_head == self.food:
@@ -79,51 +219,54 @@ class Snake:
             self.moves_left = min(self.moves_left + 100, 500)
             self.moves_without_food = 0
             self.food = self._spawn_food()
+            
+            # The snake fills the whole board: nothing left to eat
+            if self.food is None:
+                self.won = True
+                self.dead = True
+                self.death_cause = "won"
+                return False
+            self.start_loop_check()
         else:
-            self.body.pop()
+            tail = self.body.pop()
+            self.cells.remove(tail)
+            self.body_index.remove(tail[0], tail[1])
+            
+            cell = new_head[1] * self.grid_width + new_head[0]
+            self.path.append(cell)
+            tail_cell = tail[1] * self.grid_width + tail[0]
+            self.loop_hash = loop_hash = (self.loop_hash * LOOP_HASH_BASE + cell + 1 -
+                                          (tail_cell + 1) * self.loop_power) & LOOP_HASH_MASK
+            if (loop_hash ^ DIRECTION_SALTS[self.direction.value] == self.saved_key and self.detect_loops and
+                    self._same_body_as_saved()):
+                # Ends now, credited with the moves it would have starved after
+                self.dead = True
+                self.death_cause = "loop"
+                self.moves_left -= STARVATION_MOVES - self.moves_without_food
+                self.moves_without_food = STARVATION_MOVES
+                return False
+            self.since_saved += 1
+            if self.since_saved == self.loop_span:
+                self._save_state(2 * self.loop_span)
             
         return True
         
     def get_vision(self):
-        head = self.body[0]
-        directions = [
-            (0, -1), (1, -1), (1, 0), (1, 1),
-            (0, 1), (-1, 1), (-1, 0), (-1, -1)
-        ]
-        
-        vision = []
-        max_dist = max(self.grid_width, self.grid_height)
-        
-        for dx, dy in directions:
-            food_dist = 1.0
-            body_dist = 1.0
-            wall_dist = 1.0
-            
-            x, y = head
-            step = 0
-            
-            while True:
-                x += dx
-                y += dy
-                step += 1
-                
-                # Wall detection
-                if x < 0 or x >= self.grid_width or y < 0 or y >= self.grid_height:
-                    wall_dist = min(1.0, step / max_dist)
-                    break
-                
-                # Body detection
-                if (x, y) in self.body and body_dist == 1.0:
-                    body_dist = min(1.0, step / max_dist)
-                
-                # Food detection
-                if (x, y) == self.food and food_dist == 1.0:
-                    food_dist = min(1.0, step / max_dist)
-                
-                if step >= max_dist:
-                    break
-            
-            # Add the three vision metrics for this direction
-            vision.extend([food_dist, body_dist, wall_dist])
-        
-        return np.array(vision)
\ No newline at end of file
+        return self.vision_tables.get_vision(self.body[0], self.food, self.body_index)
+    
+    def _timed_move(self):
+        if self.dead:
+            return False
+        start = time.perf_counter()
+        alive = Snake.move(self)
+        self.metrics.add_time("move", time.perf_counter() - start)
+        self.metrics.count("steps")
+        if not alive:
+            self.metrics.count_death(self.death_cause)
+        return alive
+    
+    def _timed_get_vision(self):
+        start = time.perf_counter()
+        vision = Snake.get_vision(self)
+        self.metrics.add_time("vision", time.perf_counter() - start)
+        return vision
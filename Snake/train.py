@@ -0,0 +1,233 @@
+from genetic import GeneticAlgorithm
+from neural_network import SnakeAI
+from snake import Snake, Direction
+from batch_env import BatchSnakeEnv
+from replay import ReplayLog
+from metrics import Metrics
+from genome import ARCHIVE_DTYPES, GENOME_DTYPES
+import argparse
+import os
+import sys
+import time
+
+# Constants
+GRID_WIDTH = 40
+GRID_HEIGHT = 30
+
+class HeadlessTrainer:
+    def __init__(self, snake, ai, ga, env=None, evaluator=None, replay_dir=None):
+        self.snake = snake
+        self.ai = ai
+        self.ga = ga
+        self.env = env
+        self.evaluator = evaluator
+        self.total_moves = 0
+        self.metrics = ai.metrics
+        
+        # With replay_dir, every episode of a generation is kept and saved
+        # there as generation_<n>.npz
+        self.replay_dir = replay_dir
+        self.replay_log = None
+
+    def play_episode(self):
+        self.snake.reset(self.ai.current_food_seed())
+        with self.metrics.phase("evaluate"):
+            while True:
+                vision = self.snake.get_vision()
+                move = self.ai.get_move(vision)
+                self.snake.change_direction(Direction(move))
+                self.total_moves += 1
+                if not self.snake.move():
+                    break
+
+        if self.replay_log is not None:
+            self.replay_log.add_snake(self.snake, self.ai.current_snake_idx, self.ai.current_episode)
+        self.ai.update_fitness(self.snake.score, self.snake.moves_left)
+
+    def play_round_batch(self):
+        # Every individual of the round plays its own game in the batch environment
+        env = self.env
+        with self.metrics.phase("evaluate"):
+            self.total_moves += env.play(self.ai.round_policy(), seeds=self.ai.round_food_seeds())
+        if self.replay_log is not None:
+            self.replay_log.add_batch(env, self.ai.round_individuals, self.ai.current_episode)
+        self.ai.update_population_fitness(env.score, env.moves_left)
+
+    def play_round_parallel(self):
+        moves = self.evaluator.moves
+        with self.metrics.phase("evaluate"):
+            scores, moves_left = self.evaluator.evaluate(self.ai.population, self.ai.round_food_seeds(),
+                                                         record=self.replay_log is not None,
+                                                         indices=self.ai.round_individuals,
+                                                         episode=self.ai.current_episode)
+        self.total_moves += self.evaluator.moves - moves
+        self.metrics.count("steps", self.evaluator.moves - moves)
+        self.metrics.count_deaths(self.evaluator.death_causes)
+        if self.replay_log is not None:
+            self.replay_log.extend(self.evaluator.replay_log)
+        self.ai.update_population_fitness(scores, moves_left)
+
+    def run_generation(self):
+        generation = self.ga.generation
+        if self.replay_dir is not None:
+            self.replay_log = ReplayLog(self.snake.grid_width, self.snake.grid_height)
+
+        # The AI evolves the population once the last game of the last round
+        # has been played
+        while self.ga.generation == generation:
+            if self.ai.round_answered():
+                self.ai.finish_round()
+            elif self.evaluator is not None:
+                self.play_round_parallel()
+            elif self.env is not None:
+                self.play_round_batch()
+            else:
+                self.play_episode()
+
+        if self.replay_log is not None:
+            self.save_replays(generation)
+
+    def save_replays(self, generation):
+        os.makedirs(self.replay_dir, exist_ok=True)
+        path = os.path.join(self.replay_dir, f"generation_{generation:04d}.npz")
+        self.replay_log.save(path)
+        print(f"Saved {len(self.replay_log)} replays to {path} ({os.path.getsize(path) / 1024:.1f} KB)")
+
+    def train(self, generations, report_every=1):
+        self.metrics.start(self.ga.generation)
+        start_time = time.perf_counter()
+        start_moves = self.total_moves
+
+        for i in range(generations):
+            gen_start = time.perf_counter()
+            gen_moves = self.total_moves
+            self.run_generation()
+            gen_time = time.perf_counter() - gen_start
+
+            if report_every and (i + 1) % report_every == 0:
+                moves = self.total_moves - gen_moves
+                print(f"Generation {self.ga.generation}: {gen_time:.2f}s, "
+                      f"{1 / gen_time:.3f} gens/sec, {moves / gen_time:.0f} moves/sec")
+
+        elapsed = time.perf_counter() - start_time
+        moves = self.total_moves - start_moves
+        print(f"Trained {generations} generations in {elapsed:.2f}s "
+              f"({generations / elapsed:.3f} gens/sec, {moves / elapsed:.0f} moves/sec)")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Train the Snake AI without a display.")
+    parser.add_argument("--generations", type=int, default=50)
+    parser.add_argument("--population-size", type=int, default=3000)
+    parser.add_argument("--mutation-rate", type=float, default=0.02)
+    parser.add_argument("--seed", type=int,
+                        help="root seed; the same seed and options reproduce a run exactly")
+    parser.add_argument("--genome-dtype", choices=list(GENOME_DTYPES), default="float32",
+                        help="precision genomes are evolved and played in")
+    parser.add_argument("--checkpoint-dtype", choices=list(ARCHIVE_DTYPES),
+                        help="precision checkpoints are stored in (default: the genome dtype); "
+                             "float16 halves their size")
+    parser.add_argument("--grid-width", type=int, default=GRID_WIDTH)
+    parser.add_argument("--grid-height", type=int, default=GRID_HEIGHT)
+    parser.add_argument("--resume", metavar="CHECKPOINT",
+                        help="continue from a saved population checkpoint (e.g. population)")
+    parser.add_argument("--batch", action="store_true",
+                        help="evaluate the whole population at once with BatchSnakeEnv")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="evaluate in N worker processes (implies batch evaluation)")
+    parser.add_argument("--report-every", type=int, default=1,
+                        help="print throughput every N generations (0 disables)")
+    parser.add_argument("--episodes", type=int, default=1,
+                        help="games per individual and generation; fitness aggregates them")
+    parser.add_argument("--aggregate", choices=["mean", "median", "min"], default="mean",
+                        help="how episode fitnesses combine into an individual's fitness")
+    parser.add_argument("--keep-fraction", type=float, default=0.5,
+                        help="share of each round's individuals that play another episode")
+    parser.add_argument("--metrics", metavar="PATH",
+                        help="write per-generation timings, counters and fitness stats to a .jsonl or .csv file")
+    parser.add_argument("--profile-generation", type=int, metavar="N",
+                        help="run generation N under cProfile and save the stats")
+    parser.add_argument("--replay-dir", metavar="DIR",
+                        help="save every episode of each generation as a replay log in DIR")
+    parser.add_argument("--shared-seeds", action="store_true",
+                        help="every generation plays the same food seeds, so a genome's fitness never changes")
+    parser.add_argument("--fitness-cache", type=int, default=0, metavar="SIZE",
+                        help="remember up to SIZE game results by genome and food seed instead of replaying them "
+                             "(pays off with --shared-seeds)")
+    parser.add_argument("--islands", type=int, default=0,
+                        help="split the population into N islands evolved in parallel processes")
+    parser.add_argument("--migration-interval", type=int, default=10,
+                        help="generations islands evolve alone between migrations")
+    parser.add_argument("--migrants", type=int, default=5,
+                        help="best individuals each island sends at a migration")
+    parser.add_argument("--topology", choices=["ring", "random"], default="ring",
+                        help="which island receives each island's migrants")
+    parser.add_argument("--island-history", metavar="PATH", default="island_history.json",
+                        help="where per-island fitness histories are written")
+    parser.add_argument("--island-checkpoint", metavar="PREFIX", default="island",
+                        help="island k's population is checkpointed to PREFIX_k after every migration")
+    args = parser.parse_args(argv)
+    if args.islands:
+        # Islands evaluate in batches and keep their own state in worker processes
+        unsupported = [flag for flag, value in (("--resume", args.resume), ("--shared-seeds", args.shared_seeds),
+                                                ("--fitness-cache", args.fitness_cache), ("--metrics", args.metrics),
+                                                ("--profile-generation", args.profile_generation is not None),
+                                                ("--replay-dir", args.replay_dir), ("--workers", args.workers))
+                       if value]
+        if unsupported:
+            parser.error(f"{', '.join(unsupported)} cannot be combined with --islands")
+    return args
+
+def train_islands(args):
+    # Islands bring their own worker processes, so they are only imported here
+    from islands import IslandModel
+    model = IslandModel(args.islands, args.population_size, args.grid_width, args.grid_height,
+                        mutation_rate=args.mutation_rate, seed=args.seed, dtype=GENOME_DTYPES[args.genome_dtype],
+                        migration_interval=args.migration_interval, migrants=args.migrants,
+                        topology=args.topology, episodes=args.episodes, aggregate=args.aggregate,
+                        keep_fraction=args.keep_fraction)
+    with model:
+        model.train(args.generations, report_every=args.report_every, history_path=args.island_history,
+                    checkpoint_prefix=args.island_checkpoint, brain_path="best_brain_auto.pkl",
+                    checkpoint_dtype=ARCHIVE_DTYPES[args.checkpoint_dtype] if args.checkpoint_dtype else None)
+    print(f"Per-island fitness history saved to {args.island_history}")
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.islands:
+        train_islands(args)
+        return
+    ga = GeneticAlgorithm(population_size=args.population_size, mutation_rate=args.mutation_rate, seed=args.seed,
+                          dtype=GENOME_DTYPES[args.genome_dtype], shared_seeds=args.shared_seeds)
+    snake = Snake(args.grid_width, args.grid_height)
+    metrics = Metrics(args.metrics, profile_generation=args.profile_generation)
+    snake.set_metrics(metrics)
+    try:
+        ai = SnakeAI(ga, checkpoint=args.resume, episodes=args.episodes, aggregate=args.aggregate,
+                     keep_fraction=args.keep_fraction, fitness_cache=args.fitness_cache, metrics=metrics)
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+    if args.checkpoint_dtype:
+        ai.checkpoint_writer.dtype = ARCHIVE_DTYPES[args.checkpoint_dtype]
+    env = None
+    evaluator = None
+    if args.workers:
+        # multiprocessing is only loaded when worker processes are asked for
+        from parallel import ParallelEvaluator
+        evaluator = ParallelEvaluator(ai.population, args.grid_width, args.grid_height,
+                                      num_workers=args.workers)
+    elif args.batch:
+        env = BatchSnakeEnv(ga.population_size, args.grid_width, args.grid_height)
+        env.metrics = metrics
+
+    trainer = HeadlessTrainer(snake, ai, ga, env=env, evaluator=evaluator, replay_dir=args.replay_dir)
+    try:
+        trainer.train(args.generations, report_every=args.report_every)
+    finally:
+        if evaluator is not None:
+            evaluator.close()
+        ai.close()
+        metrics.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+import numpy as np
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+from functools import lru_cache
+
+# The 8 ray directions of Snake.get_vision, clockwise from UP
+VISION_DIRECTIONS = np.array([
+    (0, -1), (1, -1), (1, 0), (1, 1),
+    (0, 1), (-1, 1), (-1, 0), (-1, -1)
+])
+DIRECTION_INDEX = {(int(dx), int(dy)): d for d, (dx, dy) in enumerate(VISION_DIRECTIONS)}
+
+# Ray direction of an offset, indexed by (sign(dx) + 1) * 3 + sign(dy) + 1;
+# 8 for no offset at all
+SIGN_TO_DIRECTION = np.full(9, len(VISION_DIRECTIONS))
+for (dx, dy), d in DIRECTION_INDEX.items():
+    SIGN_TO_DIRECTION[(dx + 1) * 3 + dy + 1] = d
+
+@lru_cache(maxsize=None)
+def get_vision_tables(grid_width, grid_height):
+    # Tables only depend on the board size, so every snake on it shares them
+    return VisionTables(grid_width, grid_height)
+
+class BodyIndex:
+    # The occupied cells of one board, sorted along the four line families
+    # the vision rays follow: rows and diagonals by x, columns by y. The
+    # first body cell along a ray is then one bisection into one line, and
+    # the index only holds lines the body touches, whatever the board size.
+    def __init__(self, cells=()):
+        self.rows = defaultdict(list)           # y -> xs
+        self.columns = defaultdict(list)        # x -> ys
+        self.diagonals = defaultdict(list)      # x - y -> xs
+        self.antidiagonals = defaultdict(list)  # x + y -> xs
+        for x, y in cells:
+            self.add(x, y)
+
+    def add(self, x, y):
+        insort(self.rows[y], x)
+        insort(self.columns[x], y)
+        insort(self.diagonals[x - y], x)
+        insort(self.antidiagonals[x + y], x)
+
+    def remove(self, x, y):
+        line = self.rows[y]
+        del line[bisect_left(line, x)]
+        line = self.columns[x]
+        del line[bisect_left(line, y)]
+        line = self.diagonals[x - y]
+        del line[bisect_left(line, x)]
+        line = self.antidiagonals[x + y]
+        del line[bisect_left(line, x)]
+
+    def body_steps(self, x, y):
+        # Steps from (x, y) to the first body cell along each ray, in
+        # VISION_DIRECTIONS order; 0 where the ray sees no body
+        row = self.rows.get(y, ())
+        column = self.columns.get(x, ())
+        diagonal = self.diagonals.get(x - y, ())
+        antidiagonal = self.antidiagonals.get(x + y, ())
+        return (
+            _steps_before(column, y),       # up
+            _steps_after(antidiagonal, x),  # up-right
+            _steps_after(row, x),           # right
+            _steps_after(diagonal, x),      # down-right
+            _steps_after(column, y),        # down
+            _steps_before(antidiagonal, x), # down-left
+            _steps_before(row, x),          # left
+            _steps_before(diagonal, x),     # up-left
+        )
+
+def _steps_after(line, position):
+    i = bisect_right(line, position)
+    return line[i] - position if i < len(line) else 0
+
+def _steps_before(line, position):
+    i = bisect_left(line, position)
+    return position - line[i - 1] if i else 0
+
+class VisionTables:
+    # Distance table for one board size. Walls are found from the head
+    # position and body hits from the body itself (a BodyIndex for one snake,
+    # the body cells for a batch), so nothing here grows with the board area
+    # and no game needs a dense occupancy grid.
+    def __init__(self, grid_width, grid_height):
+        self.grid_width = grid_width
+        self.grid_height = grid_height
+        self.max_dist = max(grid_width, grid_height)
+
+        # dist[step] is the normalised distance Snake.get_vision reports for a hit
+        steps = np.arange(self.max_dist + 1)
+        self.dist = np.minimum(1.0, steps / self.max_dist)
+        self.dist_list = self.dist.tolist()
+
+    def wall_steps(self, x, y):
+        # Step at which each ray leaves the board, in VISION_DIRECTIONS order
+        up = y + 1
+        right = self.grid_width - x
+        down = self.grid_height - y
+        left = x + 1
+        return (up, min(up, right), right, min(down, right), down, min(down, left), left, min(up, left))
+
+    def wall_steps_batch(self, heads):
+        x = heads[:, 0]
+        y = heads[:, 1]
+        up = y + 1
+        right = self.grid_width - x
+        down = self.grid_height - y
+        left = x + 1
+        return np.stack([up, np.minimum(up, right), right, np.minimum(down, right),
+                         down, np.minimum(down, left), left, np.minimum(up, left)], axis=1)
+
+    def get_vision(self, head, food, body_index):
+        # Single-snake version of get_vision_batch
+        head_x, head_y = head
+        dist = self.dist_list
+        wall_steps = self.wall_steps(head_x, head_y)
+        body_steps = body_index.body_steps(head_x, head_y)
+
+        # Food: at most one ray can see it (there is none once the board is full)
+        food_dist = [1.0] * len(VISION_DIRECTIONS)
+        if food is not None:
+            offset_x = food[0] - head_x
+            offset_y = food[1] - head_y
+            food_steps = max(abs(offset_x), abs(offset_y))
+            if food_steps > 0 and offset_x in (0, food_steps, -food_steps) and offset_y in (0, food_steps, -food_steps):
+                d = DIRECTION_INDEX[(offset_x // food_steps, offset_y // food_steps)]
+                if food_steps < wall_steps[d]:
+                    food_dist[d] = dist[food_steps]
+
+        vision = []
+        for d in range(len(VISION_DIRECTIONS)):
+            vision += (food_dist[d], dist[body_steps[d]] if body_steps[d] else 1.0, dist[wall_steps[d]])
+        return np.array(vision)
+
+    def get_vision_batch(self, heads, foods, bodies):
+        # heads and foods are (N, 2) arrays of (x, y); bodies is (N, L) of
+        # flat body cells (y * grid_width + x), -1 for unused slots. Returns
+        # (N, 24) with the same layout and values as Snake.get_vision.
+        n = len(heads)
+        wall_steps = self.wall_steps_batch(heads)
+        vision = np.empty((n, len(VISION_DIRECTIONS), 3))
+
+        # Food: on the ray if the offset is a positive multiple of the direction
+        offset = foods - heads
+        food_steps = np.abs(offset).max(axis=1)[:, np.newaxis]
+        on_ray = ((offset[:, np.newaxis, :] == VISION_DIRECTIONS * food_steps[..., np.newaxis]).all(axis=2) &
+                  (food_steps > 0) & (food_steps < wall_steps))
+        vision[:, :, 0] = np.where(on_ray, self.dist[np.minimum(food_steps, self.max_dist)], 1.0)
+
+        # Body: every body cell on a ray through the head competes for the
+        # nearest hit on that ray
+        dx = bodies % self.grid_width - heads[:, 0:1]
+        dy = bodies // self.grid_width - heads[:, 1:2]
+        steps = np.maximum(np.abs(dx), np.abs(dy))
+        visible = (bodies >= 0) & ((dx == 0) | (dy == 0) | (np.abs(dx) == np.abs(dy)))
+        games, slots = np.nonzero(visible)
+        directions = SIGN_TO_DIRECTION[(np.sign(dx[games, slots]) + 1) * 3 + np.sign(dy[games, slots]) + 1]
+        body_steps = np.full((n, len(VISION_DIRECTIONS) + 1), self.max_dist + 1)
+        np.minimum.at(body_steps, (games, directions), steps[games, slots])
+        body_steps = body_steps[:, :len(VISION_DIRECTIONS)]
+        vision[:, :, 1] = np.where(body_steps <= self.max_dist, self.dist[np.minimum(body_steps, self.max_dist)], 1.0)
+
+        vision[:, :, 2] = self.dist[wall_steps]
+        return vision.reshape(n, -1)